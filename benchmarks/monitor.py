@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark decoding of `rc -m` monitor streams.
+
+Compares the incremental `JSONStream` decoder against the former line
+based brace counting. Either decodes recorded streams, e.g. captured
+from a large project via
+
+    rc --json -m > checkstyle.json
+
+or, without any arguments, a synthetic multi-megabyte stream.
+
+Run from the package root:
+
+    python benchmarks/monitor.py [recorded stream ...]
+
+"""
+
+import json
+import os
+import sys
+
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from plugin import jsonstream  # noqa: E402
+
+
+def synthetic(files=400, issues=50, indent=1):
+    """Render a stream of checkStyle messages, one per file."""
+    messages = []
+
+    for index in range(files):
+        file = "/src/project/module{}/source{}.cpp".format(index % 20, index)
+        diagnostics = []
+        for line in range(issues):
+            diagnostics.append({
+                'type': 'error' if line % 3 else 'warning',
+                'line': line + 1,
+                'column': 5,
+                'length': 3,
+                'message': "expected '}}' at end of member list {}".format(
+                    line),
+                'children': [{
+                    'type': 'note',
+                    'line': line + 1,
+                    'column': 1,
+                    'message': "to match this '{'"
+                }]
+            })
+        messages.append(json.dumps(
+            {'checkStyle': {file: diagnostics}},
+            indent=indent))
+
+    return ("\n".join(messages) + "\n").encode('utf-8')
+
+
+def legacy(lines):
+    """The former decoder, counting braces per line."""
+    values = 0
+    buffer = ''
+    brackets_open = 0
+
+    for line in lines:
+        line = line.decode('utf-8')
+
+        brackets_open += line.count('{')
+        brackets_open -= line.count('}')
+
+        buffer += line
+
+        if brackets_open <= 0:
+            try:
+                json.loads(buffer)
+                values += 1
+            except ValueError:
+                pass
+            buffer = ''
+
+    return values
+
+
+def incremental(lines):
+    stream = jsonstream.JSONStream()
+    values = 0
+
+    for line in lines:
+        for _ in stream.feed(line):
+            values += 1
+
+    return values
+
+
+def chunked(data, size=64 * 1024):
+    return [data[offset:offset + size]
+            for offset in range(0, len(data), size)]
+
+
+def measure(name, decoder, lines, size, repeat=3):
+    best = None
+    values = 0
+
+    for _ in range(repeat):
+        start = perf_counter()
+        values = decoder(lines)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("{:<12} {:>8} values {:>10.1f} ms {:>8.1f} MB/s".format(
+        name,
+        values,
+        best * 1000.0,
+        size / best / 1024.0 / 1024.0))
+
+
+def main(files):
+    streams = []
+
+    if files:
+        for file in files:
+            with open(file, 'rb') as stream:
+                streams.append((file, stream.read()))
+    else:
+        streams.append(("synthetic, indented", synthetic()))
+        streams.append(("synthetic, compact", synthetic(indent=None)))
+
+    for (name, data) in streams:
+        lines = data.splitlines(keepends=True)
+
+        print("{}: {:.1f} MB in {} lines".format(
+            name,
+            len(data) / 1024.0 / 1024.0,
+            len(lines)))
+
+        measure("legacy", legacy, lines, len(data))
+        measure("incremental", incremental, lines, len(data))
+        measure("chunked", incremental, chunked(data), len(data))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
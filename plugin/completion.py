@@ -8,10 +8,18 @@ Completion descision logic.
 
 import sublime
 
+import collections
 import logging
 
+from threading import RLock
+from time import time
+
 from . import jobs
+from . import metrics
 from . import settings
+from . import snapshot
+from . import trace
+from . import triggers
 from . import vc_manager
 
 log = logging.getLogger("RTags")
@@ -31,41 +39,65 @@ class PositionStatus:
     WRONG_TRIGGER = 2
 
 
-def position_status(point, view):
-    """Check if the cursor focuses a valid trigger.
+def match_trigger(point, view):
+    """Find the trigger the cursor focuses.
 
     Args:
         point (int): position of the cursor in the file as defined by subl
         view (sublime.View): current view
 
     Returns:
-        PositionStatus: status for this position
+        tuple: the trigger matched or None, and whether a trigger matched
+        partially only
     """
-    trigger_length = 1
-
-    word_on_the_left = view.substr(view.word(point - trigger_length))
-    if word_on_the_left.isdigit():
-        # don't autocomplete digits
-        log.debug("Trying to auto-complete digit, are we? Not allowed")
-        return PositionStatus.WRONG_TRIGGER
-
     # slightly counterintuitive `view.substr` returns ONE character
     # to the right of given point.
-    curr_char = view.substr(point - trigger_length)
+    curr_char = view.substr(point - 1)
     wrong_trigger_found = False
     for trigger in settings.get('triggers'):
         # compare to the last char of a trigger
         if curr_char == trigger[-1]:
-            trigger_length = len(trigger)
-            prev_char = view.substr(point - trigger_length)
+            prev_char = view.substr(point - len(trigger))
             if prev_char == trigger[0]:
                 log.debug("Matched trigger '%s'", trigger)
-                return PositionStatus.COMPLETION_NEEDED
+                return (trigger, False)
             else:
                 log.debug("Wrong trigger '%s%s'", prev_char, curr_char)
                 wrong_trigger_found = True
 
+    return (None, wrong_trigger_found)
+
+
+def position_status(point, view):
+    """Check if the cursor focuses a valid trigger.
+
+    Args:
+        point (int): position of the cursor in the file as defined by subl
+        view (sublime.View): current view
+
+    Returns:
+        PositionStatus: status for this position
+    """
+    trigger_length = 1
+
+    word_on_the_left = view.substr(view.word(point - trigger_length))
+    if word_on_the_left.isdigit():
+        # don't autocomplete digits
+        log.debug("Trying to auto-complete digit, are we? Not allowed")
+        return PositionStatus.WRONG_TRIGGER
+
+    (trigger, wrong_trigger_found) = match_trigger(point, view)
+
+    if trigger:
+        if not triggers.worth_completing(view, point, trigger):
+            return PositionStatus.COMPLETION_NOT_NEEDED
+        return PositionStatus.COMPLETION_NEEDED
+
     if wrong_trigger_found:
+        if triggers.ignored(view, point - trigger_length):
+            log.debug("Ignoring wrong trigger in comment or string")
+            return PositionStatus.COMPLETION_NOT_NEEDED
+
         # no correct trigger found, but a wrong one fired instead
         log.debug("Wrong trigger fired")
         return PositionStatus.WRONG_TRIGGER
@@ -75,20 +107,398 @@ def position_status(point, view):
     return PositionStatus.COMPLETION_NOT_NEEDED
 
 
-query_suggestions = []
-query_completion_job_id = None
+class Cache():
+    """Size-bounded LRU cache of completion results.
+
+    Results are keyed by file, trigger position and the buffer contents
+    up to the trigger, the parts that decide what completes there. Each
+    also remembers the code right before its trigger, for telling
+    comparable positions.
+
+    The key last computed per view stays valid for its change count.
+    Where Sublime tells where the text changed, it also stays valid while
+    the view only gets modified behind its trigger, as it does while
+    typing on, so that the buffer contents need not be hashed again on
+    every keystroke.
+    """
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.contexts = {}
+        # Latest key per view-id, as tuple (change count, key).
+        self.keys = {}
+        self.lock = RLock()
+
+    def key(self, view, trigger_position):
+        change_count = view.change_count()
+
+        with self.lock:
+            memo = self.keys.get(view.id())
+
+        if memo and memo[0] == change_count and \
+                memo[1][1] == trigger_position:
+            return memo[1]
+
+        text = view.substr(sublime.Region(0, trigger_position))
+        key = (
+            view.file_name(),
+            trigger_position,
+            vc_manager.digest(text.encode('utf-8')))
+
+        with self.lock:
+            self.keys[view.id()] = (change_count, key)
+
+        return key
+
+    def modified(self, view, begin):
+        """Keep the latest key of `view` if modified behind its trigger.
+
+        `begin` is where the first of the changes in question starts.
+        """
+        with self.lock:
+            memo = self.keys.get(view.id())
+
+            if not memo:
+                return
+
+            (_, trigger_position, _) = memo[1]
+
+            if begin >= trigger_position:
+                self.keys[view.id()] = (view.change_count(), memo[1])
+            else:
+                del self.keys[view.id()]
+
+    def forget(self, view):
+        with self.lock:
+            self.keys.pop(view.id(), None)
+
+    @staticmethod
+    def context(view, trigger_position, trigger):
+        """The trigger along with the word before it, like `foo->`."""
+        start = trigger_position - len(trigger)
+        word = view.substr(view.word(start - 1)) if start > 0 else ""
+        return word.strip() + trigger
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, completions, context=None):
+        size = int(settings.get('completion_cache_size', 32))
+
+        with self.lock:
+            self.entries[key] = completions
+            self.entries.move_to_end(key)
+            self.contexts[key] = context
+
+            while len(self.entries) > size:
+                (evicted, _) = self.entries.popitem(last=False)
+                del self.contexts[evicted]
+
+    def comparable(self, key, context):
+        """Latest results of the same file at the same position, else
+        after the same code, even if the buffer changed since.
+        """
+        (filename, trigger_position, _) = key
+
+        with self.lock:
+            others = [other for other in reversed(self.entries)
+                      if other[0] == filename]
+
+            for other in others:
+                if other[1] == trigger_position:
+                    return self.entries[other]
+
+            for other in others:
+                if context and self.contexts[other] == context:
+                    return self.entries[other]
+
+        return None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.contexts.clear()
+            self.keys.clear()
+
+
+class Symbols():
+    """Symbols seen in completion results, by file.
+
+    Serves as a last resort for completing while `rdm` has got no
+    results to offer.
+    """
+    MAX_SYMBOLS = 1000
+
+    def __init__(self):
+        self.files = collections.OrderedDict()
+        self.lock = RLock()
+
+    def add(self, filename, completions):
+        size = int(settings.get('completion_cache_size', 32))
+
+        with self.lock:
+            table = self.files.pop(filename, collections.OrderedDict())
+
+            for completion in completions:
+                table.pop(completion.name, None)
+                table[completion.name] = completion
+
+            while len(table) > Symbols.MAX_SYMBOLS:
+                table.popitem(last=False)
+
+            self.files[filename] = table
+
+            while len(self.files) > size:
+                self.files.popitem(last=False)
+
+    def get(self, filename):
+        with self.lock:
+            if filename not in self.files:
+                return []
+
+            return list(self.files[filename].values())
+
+    def clear(self):
+        with self.lock:
+            self.files.clear()
+
+
+cache = Cache()
+symbols = Symbols()
+
+
+def matches(prefix, name):
+    """Check if all characters of `prefix` appear in `name` in order."""
+    characters = iter(name)
+    return all(character in characters for character in prefix)
+
+
+def filter_completions(completions, prefix):
+    """Completions matching the typed prefix, best matches first.
+
+    Symbols starting with the prefix come first, then those starting with
+    it in any case, then those containing its characters in order.
+    """
+    if not prefix:
+        return completions
+
+    lowered = prefix.lower()
+    ranked = []
+
+    for index, completion in enumerate(completions):
+        name = completion.name
+
+        if name.startswith(prefix):
+            rank = 0
+        elif name.lower().startswith(lowered):
+            rank = 1
+        elif matches(lowered, name.lower()):
+            rank = 2
+        else:
+            continue
+
+        ranked.append((rank, index, completion))
+
+    return [completion for (_, _, completion) in sorted(ranked)]
+
+
+def suggestions(completions, prefix):
+    """Render the completions to show for the typed prefix."""
+    return [completion.render()
+            for completion in filter_completions(completions, prefix)]
+
+
+# Seconds until a file needs warming up again.
+WARM_UP_INTERVAL = 300.0
+
+# Last warm-up per file, as { filename => time }.
+warmed = {}
+
+# Warm-up job in flight per view-id.
+warming = {}
+
+# Guards `warmed`, `warming` and `expected`, which the job threads touch
+# as well.
+lock = RLock()
+
+# Results awaited per view-id, as their cache key. Either the arrival of
+# those results or a query finding them cached shows them, never both.
+expected = {}
+
+
+def warm_up(view):
+    """Have `rdm` parse the file of `view` ahead of any completion.
+
+    The first completion in a file pays for parsing it. A request at the
+    start of the file takes care of that in the background. Any real
+    completion request supersedes it, typing and switching views cancel
+    it.
+    """
+    filename = view.file_name()
+    job_id = "RTCompletionWarmUpJob" + jobs.JobController.next_id()
+    started = time()
+
+    with lock:
+        if started - warmed.get(filename, 0) < WARM_UP_INTERVAL:
+            return
+
+        if view.id() in warming:
+            return
+
+        warmed[filename] = started
+        warming[view.id()] = job_id
+
+    def done(future):
+        with lock:
+            if warming.get(view.id()) == job_id:
+                del warming[view.id()]
+
+            # Try again next time around, unless `rdm` got to parse the
+            # file.
+            if not future or future.cancelled() or future.exception() or \
+                    future.result()[2]:
+                if warmed.get(filename) == started:
+                    del warmed[filename]
+
+    log.debug("Warming up completion for {}".format(filename))
+
+    future = jobs.JobController.run_async(
+        jobs.CompletionWarmUpJob(
+            job_id,
+            filename,
+            snapshot.text(view),
+            view.size(),
+            0,
+            0,
+            view,
+            1,
+            lane='background'))
+
+    if not future:
+        done(None)
+        return
+
+    future.add_done_callback(done)
+
+
+def cancel_warm_up(view):
+    with lock:
+        job_id = warming.pop(view.id(), None)
+
+        if not job_id:
+            return
+
+        # Try again next time around.
+        warmed.pop(view.file_name(), None)
+
+    log.debug("Cancelling completion warm-up {}".format(job_id))
+
+    jobs.JobController.cancel(job_id)
 
 
 def reset():
-    global query_suggestions
-    global query_completion_job_id
-    query_suggestions = []
-    query_completion_job_id = None
+    cache.clear()
+    symbols.clear()
+
+    with lock:
+        warmed.clear()
+        warming.clear()
+        expected.clear()
+
+
+def expect(view, key):
+    """Await results for `key` to show in `view`."""
+    with lock:
+        expected[view.id()] = key
+
+
+def take(view, key):
+    """Check if results for `key` still await being shown in `view`.
+
+    Only the first one asking gets told so.
+    """
+    with lock:
+        if expected.get(view.id()) != key:
+            return False
+
+        del expected[view.id()]
+        return True
+
+
+def deliver(view, key, trigger_position, completion_job_id):
+    """Show freshly arrived results, on the main thread."""
+    if not take(view, key):
+        log.debug("Results of {} got shown already".format(
+            completion_job_id))
+        return
+
+    # Typing, clicking or switching views meanwhile leaves those results
+    # behind.
+    active_view = sublime.active_window().active_view()
+    if view != active_view:
+        log.debug("Completion view has lost focus")
+        return
+
+    current_position = view.sel()[0].a
+    valid_positions = [current_position, view.word(current_position).a]
+
+    if trigger_position not in valid_positions:
+        log.debug("Completion trigger position has changed")
+        return
+
+    # Alongside all other phases of completion jobs.
+    with metrics.Timer(jobs.CompletionJob.__name__, 'render'):
+        # Hide the completion we might currently see as those are
+        # either sublime's own completions which are not that useful
+        # to us C++ coders, or stale ones.
+        #
+        # This neat trick was borrowed from EasyClangComplete.
+        view.run_command('hide_auto_complete')
+
+        # Trigger a new completion event to show the freshly acquired
+        # ones.
+        view.run_command(
+            'auto_complete', {
+                'disable_auto_insert': True,
+                'api_completions_only': False,
+                'next_completion_if_showing': False})
+
+
+def fallback(view, key, context, prefix):
+    """Completions to show until `rdm` answers, if any.
+
+    Results of a comparable position come first, then symbols seen
+    before in the same file. Without either, Sublime's own completions
+    show.
+    """
+    if not settings.get('completion_fallback', True):
+        return (
+            [],
+            sublime.INHIBIT_WORD_COMPLETIONS |
+            sublime.INHIBIT_EXPLICIT_COMPLETIONS)
+
+    completions = cache.comparable(key, context)
+    if completions:
+        log.debug("Showing completions of a comparable position meanwhile")
+        return (
+            suggestions(completions, prefix),
+            sublime.INHIBIT_WORD_COMPLETIONS |
+            sublime.INHIBIT_EXPLICIT_COMPLETIONS)
+
+    completions = symbols.get(view.file_name())
+    if completions:
+        log.debug("Showing symbols of this file meanwhile")
+        return suggestions(completions, prefix)
+
+    return None
 
 
 def query(view, prefix, locations):
-    global query_suggestions
-    global query_completion_job_id
     log.debug("Completion prefix: {}".format(prefix))
 
     # libclang does auto-complete _only_ at whitespace and
@@ -109,39 +519,54 @@ def query(view, prefix, locations):
         log.debug("Completion not needed - showing default completions")
         return None
 
-    # Render some unique identifier for us to match a completion request
-    # to its original query.
-    completion_job_id = "RTCompletionJob{}".format(trigger_position)
+    # Render some unique identifier for this request. Its results get
+    # matched to the query by channel and cache key, a job still winding
+    # down at the same position must not keep it from running.
+    completion_job_id = "RTCompletionJob" + jobs.JobController.next_id()
 
     log.debug("Completion trigger with: {}".format(completion_job_id))
 
-    # If we already have a completion for this position, show that.
-    if query_completion_job_id == completion_job_id:
+    (trigger, _) = match_trigger(trigger_position, view)
+
+    key = cache.key(view, trigger_position)
+
+    # If we already have a completion for this position, show that,
+    # narrowed down to what got typed since.
+    completions = cache.get(key)
+    if completions is not None:
         log.debug("We already got a completion for this position")
-        log.debug("completion: {}".format(query_suggestions))
+
+        # These are shown now, no need to deliver them again.
+        take(view, key)
+
+        if completions:
+            triggers.acceptance.offered(view, trigger, trigger_position)
+
         return (
-            query_suggestions,
+            suggestions(completions, prefix),
             sublime.INHIBIT_WORD_COMPLETIONS |
             sublime.INHIBIT_EXPLICIT_COMPLETIONS)
 
-    # Cancel a completion that might be in flight.
-    if query_completion_job_id:
-        jobs.JobController.stop(query_completion_job_id)
+    if not triggers.acceptance.allows(trigger):
+        return None
+
+    context = Cache.context(view, trigger_position, trigger)
 
-    # We do need to trigger a new completion.
+    # We do need to trigger a new completion. Any completion that might
+    # still be in flight for this view gets superseded by it.
     log.debug("Completion job {} triggered on view {}".format(
         completion_job_id,
         view))
 
-    query_view = view
-    query_completion_job_id = completion_job_id
-    query_trigger_position = trigger_position
     row, col = view.rowcol(trigger_position)
 
-    text = bytes(view.substr(sublime.Region(0, view.size())), "utf-8")
+    text = snapshot.text(view)
 
     def completion_done(future):
-        global query_suggestions
+        with trace.Span('completion_done', 'ui', view=view.id()):
+            show_completion(future)
+
+    def show_completion(future):
         log.debug("Completion done callback hit {}".format(future))
 
         if not future.done():
@@ -152,7 +577,7 @@ def query(view, prefix, locations):
             log.warning(("Completion aborted"))
             return
 
-        (completion_job_id, suggestions, error, view) = future.result()
+        (completion_job_id, completions, error, view) = future.result()
 
         vc_manager.view_controller(view).status.update_status(error=error)
 
@@ -166,47 +591,14 @@ def query(view, prefix, locations):
             completion_job_id,
             view))
 
-        if view != query_view:
-            log.debug("Completion done for different view")
-            return
-
-        # Did we have a different completion in mind?
-        if completion_job_id != query_completion_job_id:
-            log.debug("Completion done for unexpected completion")
-            return
-
-        active_view = sublime.active_window().active_view()
-
-        # Has the view changed since triggering completion?
-        if view != active_view:
-            log.debug("Completion done for inactive view")
-            return
-
-        # We accept both current position and position to the left of the
-        # current word as valid as we don't know how much user already typed
-        # after the trigger.
-        current_position = view.sel()[0].a
-        valid_positions = [current_position, view.word(current_position).a]
+        cache.put(key, completions, context)
+        symbols.add(view.file_name(), completions)
 
-        if query_trigger_position not in valid_positions:
-            log.debug("Trigger position {} does not match valid positions"
-                      " {}".format(valid_positions, query_trigger_position))
-            return
-
-        query_suggestions = suggestions
-
-        # Hide the completion we might currently see as those are sublime's
-        # own completions which are not that useful to us C++ coders.
-        #
-        # This neat trick was borrowed from EasyClangComplete.
-        view.run_command('hide_auto_complete')
+        sublime.set_timeout(
+            lambda: deliver(view, key, trigger_position, completion_job_id),
+            0)
 
-        # Trigger a new completion event to show the freshly acquired ones.
-        view.run_command(
-            'auto_complete', {
-                'disable_auto_insert': True,
-                'api_completions_only': False,
-                'next_completion_if_showing': False})
+    expect(view, key)
 
     jobs.JobController.run_async(
         jobs.CompletionJob(
@@ -216,11 +608,10 @@ def query(view, prefix, locations):
             view.size(),
             row,
             col,
-            view),
+            view,
+            int(settings.get('completion_max_results', 1000))),
         completion_done,
         vc_manager.view_controller(view).status.progress)
 
-    return (
-        [],
-        sublime.INHIBIT_WORD_COMPLETIONS |
-        sublime.INHIBIT_EXPLICIT_COMPLETIONS)
+    # Show what we have got until the results arrive.
+    return fallback(view, key, context, prefix)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Diagnostics.
+
+Last known diagnostics of every file `rdm` checked, open or not.
+
+"""
+
+import collections
+import logging
+
+from threading import RLock
+
+from . import settings
+
+log = logging.getLogger("RTags")
+
+
+class Store():
+    """Size-bounded store of issues by filename.
+
+    Files are evicted least recently updated or viewed first, once there
+    are too many of them or too many issues in total.
+    """
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = RLock()
+
+    @staticmethod
+    def count(issues):
+        return sum(len(items) for items in issues.values())
+
+    def put(self, filename, issues):
+        max_files = int(settings.get('diagnostics_max_files', 2000))
+        max_issues = int(settings.get('diagnostics_max_issues', 50000))
+
+        with self.lock:
+            self.remove(filename)
+
+            # Clean files need no entry.
+            count = Store.count(issues)
+            if not count:
+                return
+
+            self.entries[filename] = issues
+            self.size += count
+
+            while self.entries and (
+                    len(self.entries) > max_files or self.size > max_issues):
+                (evicted, evicted_issues) = self.entries.popitem(last=False)
+                self.size -= Store.count(evicted_issues)
+                log.debug("Evicted diagnostics of {}".format(evicted))
+
+    def get(self, filename):
+        with self.lock:
+            if filename not in self.entries:
+                return None
+
+            self.entries.move_to_end(filename)
+            return self.entries[filename]
+
+    def remove(self, filename):
+        with self.lock:
+            issues = self.entries.pop(filename, None)
+            if issues:
+                self.size -= Store.count(issues)
+
+    def items(self):
+        with self.lock:
+            return list(self.entries.items())
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'files': len(self.entries),
+                'issues': self.size
+            }
+
+
+store = Store()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""Asyncio Job Engine.
+
+Runs all `rc` subprocesses on a single event loop thread instead of
+tying up a pool thread per job. Needs a plugin host running Python 3.5
+or later.
+
+"""
+
+import asyncio
+import logging
+
+from subprocess import PIPE
+from subprocess import STDOUT
+from threading import Thread
+from time import time
+
+from . import jobs
+from . import metrics
+from . import trace
+
+log = logging.getLogger("RTags")
+
+
+class ProcessHandle():
+    """Thread-safe stand-in for a `subprocess.Popen` to be killed."""
+
+    def __init__(self, loop, process):
+        self.loop = loop
+        self.process = process
+        self.pid = process.pid
+
+    def kill(self):
+        self.loop.call_soon_threadsafe(self.terminate)
+
+    def terminate(self):
+        if self.process.returncode is None:
+            self.process.kill()
+
+
+class AsyncioEngine():
+    """Job engine based on an asyncio event loop.
+
+    Offers the same futures as the thread-pool lanes do, so callbacks,
+    cancellation and `JobController.stop` work unchanged.
+    """
+    # Bytes per output line; diagnostics may come in rather long lines.
+    LINE_LIMIT = 16 * 1024 * 1024
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(
+            target=self.loop.run_forever,
+            name="RTagsEventLoop",
+            daemon=True)
+        self.thread.start()
+
+    def run_async(self, job):
+        return asyncio.run_coroutine_threadsafe(self.run(job), self.loop)
+
+    def stop(self, job):
+        job.stop()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def run(self, job):
+        with trace.Span(job.job_id, 'job', lane=job.lane, view=job.owner()):
+            (out, error) = await self.run_process(job)
+        return job.results(out, error)
+
+    async def run_process(self, job):
+        category = job.category()
+
+        if job.queued_at:
+            metrics.record(category, 'queue', time() - job.queued_at)
+
+        if job.abandoned():
+            job.p.set_result(None)
+            return (b'', jobs.JobError(
+                jobs.JobError.ABORTED,
+                "Command aborted."))
+
+        command = job.prepare_command()
+
+        timeout = job.RUN_TIMEOUT or job.timeout
+
+        start_time = time()
+
+        process = None
+        out = b''
+        error = None
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=PIPE,
+                stdout=PIPE,
+                stderr=STDOUT,
+                limit=AsyncioEngine.LINE_LIMIT)
+
+            metrics.record(category, 'spawn', time() - start_time)
+
+            job.p.set_result(ProcessHandle(self.loop, process))
+
+            with trace.Span('rc', 'process', job=job.job_id, pid=process.pid):
+                if job.streams():
+                    (out, error) = await asyncio.wait_for(
+                        self.stream(job, process),
+                        timeout)
+                else:
+                    with metrics.Timer(category, 'roundtrip'):
+                        (out, _) = await asyncio.wait_for(
+                            process.communicate(input=job.data),
+                            timeout)
+
+                    with metrics.Timer(category, 'decode'):
+                        error = jobs.JobError.from_results(
+                            out.decode('utf-8'),
+                            process.returncode)
+
+        except asyncio.TimeoutError:
+            error = jobs.JobError(jobs.JobError.ABORTED, "Command aborted.")
+
+        except Exception as e:
+            error = jobs.JobError(
+                jobs.JobError.EXCEPTION,
+                "Aborting with exception: {}".format(e))
+
+        finally:
+            # Covers timeouts as well as cancelled futures.
+            if process and process.returncode is None:
+                process.kill()
+                await process.wait()
+
+            # Never leave `stop` waiting for a process that did not start.
+            if not job.p.done():
+                job.p.set_result(None)
+
+        metrics.record(category, 'total', time() - start_time)
+
+        if error:
+            log.error("Failed to run process job {} with error: {}"
+                      .format(command, error.message))
+
+        return (out, error)
+
+    async def stream(self, job, process):
+        if job.data:
+            process.stdin.write(job.data)
+            await process.stdin.drain()
+        process.stdin.close()
+
+        with metrics.Timer(job.category(), 'roundtrip'):
+            while True:
+                if job.CHUNK_SIZE:
+                    line = await process.stdout.read(job.CHUNK_SIZE)
+                else:
+                    line = await process.stdout.readline()
+
+                if not line:
+                    break
+
+                if not job.feed(line):
+                    process.kill()
+                    break
+
+            await process.wait()
+
+        with metrics.Timer(job.category(), 'decode'):
+            return job.finish(process.returncode)
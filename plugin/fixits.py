@@ -11,8 +11,11 @@ import sublime
 import logging
 import re
 
+from . import diagnostics
 from . import jobs
+from . import reindex
 from . import settings
+from . import snapshot
 from . import tools
 from . import watchdog
 
@@ -45,8 +48,7 @@ class Controller():
         self.view = view
         self.filename = view.file_name()
         self.status = status
-        self.watchdog = watchdog.IndexWatchdog()
-        self.reindex_job_id = None
+        self.reindexing = False
 
     def region(view, line, column, length):
         start = view.text_point(
@@ -68,6 +70,16 @@ class Controller():
     def activated(self):
         log.debug("Activated")
 
+        # Show what is known about a freshly opened file right away, the
+        # monitor is going to tell about any changes.
+        if self.supported and self.issues is None and \
+                not self.view.is_dirty():
+            issues = diagnostics.store.get(self.filename)
+            if issues:
+                log.debug("Showing last known diagnostics of {}".format(
+                    self.filename))
+                self.update(self.filename, issues)
+
     def deactivated(self):
         log.debug("Deactivated")
 
@@ -282,8 +294,8 @@ class Controller():
         self.issues = {}
 
     def unload(self):
-        # Stop the watchdog and clear.
-        self.watchdog.stop()
+        # Stop waiting for the indexing and clear.
+        watchdog.service.stop(self)
         self.clear()
 
     def update(self, filename, issues):
@@ -305,6 +317,10 @@ class Controller():
 
         log.debug("Got indexing {}".format(issues))
 
+        # Nothing known about this file so far.
+        if self.issues is None:
+            self.issues = {}
+
         for key in issues:
             if key not in self.issues:
                 self.issues[key] = []
@@ -385,19 +401,14 @@ class Controller():
 
         log.debug("Got fixits to send")
 
-        sublime.active_window().active_view().run_command(
-            'rtags_fixit',
-            {
-                'filename': self.filename,
-                'issues': issues
-            })
+        sublime.set_timeout(lambda: self.update(self.filename, issues), 0)
 
     def indexing_callback(self, complete, error=None):
         log.debug("Indexing callback hit")
 
         self.status.progress.stop()
 
-        self.reindex_job_id = None
+        self.reindexing = False
 
         self.status.update_status(error)
 
@@ -420,7 +431,7 @@ class Controller():
                 [
                     '--diagnose', self.filename
                 ],
-                **{'view': self.view}
+                **{'view': self.view, 'lane': 'background'}
             ),
             indicator=self.status.progress)
 
@@ -431,7 +442,7 @@ class Controller():
                     [
                         '--fixits', self.filename
                     ],
-                    **{'view': self.view}
+                    **{'view': self.view, 'lane': 'background'}
                 ),
                 self.fixits_callback,
                 indicator=self.status.progress)
@@ -439,35 +450,28 @@ class Controller():
     def reindex(self, saved):
         log.debug("Reindex hit {} {} {}".format(self, self.view, saved))
 
-        if self.reindex_job_id:
-            log.debug("Reindex already requested")
-            return
-
         self.clear()
 
-        self.status.progress.start()
-
-        if self.supported:
-            log.debug("Expecting indexing results for {}".format(self.filename))
-            jobs.JobController.run_async(jobs.MonitorJob("RTMonitorJob"))
+        jobs.JobController.cache.invalidate(self.filename)
 
         text = b''
 
         if not saved:
-            text = bytes(
-                self.view.substr(sublime.Region(0, self.view.size())),
-                "utf-8")
+            text = snapshot.text(self.view)
 
-        self.reindex_job_id = "RTReindexJob"
+        # A former request still waiting gets replaced by this one.
+        reindex.Scheduler.submit(self.filename, text, self.view)
 
-        jobs.JobController.run_async(
-            jobs.ReindexJob(
-                self.reindex_job_id,
-                self.filename,
-                text,
-                self.view
-            )
-        )
+        if self.reindexing:
+            log.debug("Reindex already in progress")
+            return
+
+        self.reindexing = True
+
+        self.status.progress.start()
 
-        # Start a watchdog that polls if we were still indexing.
-        self.watchdog.start(self.indexing_callback)
+        # Have the watchdog tell when we are done indexing.
+        watchdog.service.start(
+            self,
+            self.indexing_callback,
+            [self.filename])
@@ -16,6 +16,7 @@ import re
 from functools import partial
 
 from . import jobs
+from . import metrics
 from . import settings
 from . import tools
 from . import vc_manager
@@ -28,6 +29,71 @@ class Category:
     ERROR = "error"
 
 
+class Hover:
+    """Debounces hover requests.
+
+    Only the latest hover of the mouse gets to query symbol info, any
+    earlier request still pending or running gets cancelled.
+    """
+    CHANNEL = "hover"
+
+    generation = 0
+    view_id = None
+    point = None
+
+    @staticmethod
+    def request(view, point):
+        Hover.cancel(view)
+
+        Hover.view_id = view.id()
+        Hover.point = point
+
+        generation = Hover.generation
+
+        sublime.set_timeout(
+            lambda: Hover.fire(view, point, generation),
+            settings.get('hover_delay', 300))
+
+    @staticmethod
+    def cancel(view):
+        Hover.generation += 1
+        Hover.view_id = None
+        Hover.point = None
+        jobs.JobController.supersede(view, Hover.CHANNEL)
+
+    @staticmethod
+    def current(view, point):
+        return Hover.view_id == view.id() and Hover.point == point
+
+    @staticmethod
+    def fire(view, point, generation):
+        if generation != Hover.generation:
+            log.debug("Hover at {} superseded".format(point))
+            return
+
+        # The view may have been closed meanwhile.
+        if not view.is_valid() or view.window() is None:
+            return
+
+        # Make sure the underlying view is in focus - enables in turn
+        # that the view-controller shows its status.
+        view.window().focus_view(view)
+
+        (row, col) = view.rowcol(point)
+        view.run_command(
+            'rtags_symbol_info',
+            {
+                'switches': [
+                    '--absolute-path',
+                    '--json',
+                    '--symbol-info'
+                ],
+                'col': col,
+                'row': row,
+                'channel': Hover.CHANNEL
+            })
+
+
 class Controller:
     MAX_POPUP_WIDTH = 1800
     MAX_POPUP_HEIGHT = 900
@@ -368,7 +434,8 @@ class Controller:
             displayed_items,
             oldrow,
             oldcol,
-            oldfile):
+            oldfile,
+            channel=None):
         log.debug("Symbol location callback hit {}".format(future))
         if not future.done():
             log.warning("Symbol location failed")
@@ -387,6 +454,23 @@ class Controller:
 
         log.debug("Finished Command job {}".format(job_id))
 
+        if channel == Hover.CHANNEL and not Hover.current(
+                view,
+                view.text_point(oldrow, oldcol)):
+            log.debug("Dropping location of a stale hover")
+            return
+
+        with metrics.Timer(metrics.category(job_id), 'render'):
+            Controller.update_location(
+                view,
+                out,
+                displayed_items,
+                oldrow,
+                oldcol,
+                oldfile)
+
+    @staticmethod
+    def update_location(view, out, displayed_items, oldrow, oldcol, oldfile):
         # It should be a single line of output.
         items = list(map(lambda x: x.decode('utf-8'), out.splitlines()))
         if not items:
@@ -427,7 +511,13 @@ class Controller:
         view.update_popup(rendered)
 
     @staticmethod
-    def action(view, row, col, out):
+    def action(view, row, col, out, channel=None):
+        location = view.text_point(row, col)
+
+        if channel == Hover.CHANNEL and not Hover.current(view, location):
+            log.debug("Dropping symbol info of a stale hover")
+            return
+
         output_json = json.loads(out.decode("utf-8"))
 
         # Naive filtering, translation and sorting.
@@ -501,8 +591,6 @@ class Controller:
             "popup",
             info)
 
-        location = view.text_point(row, col)
-
         file = view.file_name()
 
         def on_navigate(href):
@@ -535,7 +623,12 @@ class Controller:
                     '-f',
                     '{}:{}:{}'.format(file, row + 1, col + 1),
                 ],
-                **{'view': view}
+                **{
+                    'view': view,
+                    'cache_file': file,
+                    'cache_version': view.change_count(),
+                    'channel': channel
+                }
             ),
             partial(
                 Controller.symbol_location_callback,
@@ -543,5 +636,6 @@ class Controller:
                 displayed_items=displayed_items,
                 oldrow=row,
                 oldcol=col,
-                oldfile=file),
+                oldfile=file,
+                channel=channel),
             vc_manager.view_controller(view).status.progress)
@@ -6,20 +6,22 @@ Jobs are scheduled process runs.
 
 """
 
-import sublime
+import collections
 import subprocess
 
 import logging
 
-import json
-
 from concurrent import futures
 from functools import partial
 from time import time
 from threading import RLock
+from threading import Timer
 
+from . import jsonstream
+from . import metrics
 from . import settings
 from . import tools
+from . import trace
 
 log = logging.getLogger("RTags")
 
@@ -76,10 +78,19 @@ class JobError:
 
 
 class RTagsJob():
+    # Scheduling lane for this kind of job, see `JobController.lane`.
+    LANE = 'interactive'
+    # Seconds until `rc` gets aborted, `None` for the configured default.
+    RUN_TIMEOUT = None
+    # Identical in-flight jobs may share a single process.
+    COALESCE = True
+    # Streaming jobs get fed lines, or chunks of up to that many bytes.
+    CHUNK_SIZE = None
 
     def __init__(self, job_id, command_info, **kwargs):
         self.job_id = job_id
         self.command_info = command_info
+        self.lane = kwargs.get('lane', self.LANE)
         self.timeout = None
         if 'timeout' in kwargs:
             self.timeout = kwargs['timeout']
@@ -96,6 +107,18 @@ class RTagsJob():
         else:
             self.callback = self.communicate
         self.nodebug = 'nodebug' in kwargs
+        # Jobs sharing a channel on the same view supersede each other.
+        self.channel = kwargs.get('channel')
+        self.generation = None
+        self.cancelled = False
+        self.queued_at = None
+        # Results of idempotent queries may get cached, see `ResultCache`.
+        self.cache_file = kwargs.get('cache_file')
+        self.cache_version = kwargs.get('cache_version')
+        self.cache_scope = kwargs.get('cache_scope', ResultCache.PROJECT)
+        self.coalesce = kwargs.get('coalesce', self.COALESCE)
+        self.leader = None
+        self.followers = []
         self.kwargs = kwargs
         self.command_active = futures.Future()
 
@@ -106,9 +129,37 @@ class RTagsJob():
             cmd.append(settings.get('rdm_socket'))
         return cmd + self.command_info
 
+    def category(self):
+        # Plain and streaming jobs are told apart by their id, e.g.
+        # `RTFollowSymbolJob`.
+        if type(self) in (RTagsJob, StreamingJob):
+            return metrics.category(self.job_id)
+        return type(self).__name__
+
+    def cache_key(self):
+        if not self.cache_file:
+            return None
+        return (tuple(self.command_info), self.cache_file, self.cache_version)
+
+    def coalesce_key(self):
+        if not self.coalesce:
+            return None
+        return (type(self).__name__, tuple(self.prepare_command()), self.data)
+
+    def owner(self):
+        view = getattr(self, 'view', None)
+        if not view:
+            return None
+        return view.id()
+
     def active(self):
         return self.p.done()
 
+    def abandoned(self):
+        # Followers share this job's process, it is of use as long as
+        # anyone of them is still waiting for it.
+        return all(member.cancelled for member in [self] + self.followers)
+
     def stop(self):
         start_time = time()
 
@@ -118,6 +169,10 @@ class RTagsJob():
         log.debug("Awaited process startup for {:2.6f} seconds".format(
             time() - start_time))
 
+        if not process:
+            log.debug("Job {} never got a process".format(self.job_id))
+            return
+
         log.debug("Killing job command subprocess {}".format(process))
 
         # We abort the process by sending a SIGKILL and by closing all
@@ -137,19 +192,33 @@ class RTagsJob():
         if not timeout:
             timeout = self.timeout
 
-        (out, _) = process.communicate(input=self.data, timeout=timeout)
+        with metrics.Timer(self.category(), 'roundtrip'):
+            (out, _) = process.communicate(input=self.data, timeout=timeout)
 
         if not self.nodebug:
             log.debug("Static communicate terminating")
 
-        return out, JobError.from_results(
-            out.decode('utf-8'),
-            process.returncode)
+        with metrics.Timer(self.category(), 'decode'):
+            error = JobError.from_results(
+                out.decode('utf-8'),
+                process.returncode)
+
+        return out, error
 
     def run_process(self, timeout=None):
         out = b''
         error = None
 
+        if self.queued_at:
+            metrics.record(self.category(), 'queue', time() - self.queued_at)
+
+        if self.abandoned():
+            log.debug("Job {} cancelled before starting".format(self.job_id))
+            self.p.set_result(None)
+            return (self.job_id, out, JobError(
+                JobError.ABORTED,
+                "Command aborted."))
+
         command = self.prepare_command()
 
         if not self.nodebug:
@@ -164,6 +233,8 @@ class RTagsJob():
                 stdout=subprocess.PIPE,
                     stdin=subprocess.PIPE) as process:
 
+                metrics.record(self.category(), 'spawn', time() - start_time)
+
                 self.p.set_result(process)
 
                 if not self.nodebug:
@@ -173,17 +244,28 @@ class RTagsJob():
                     log.debug("Communicating with process via {}"
                               .format(self.callback))
 
-                (out, error) = self.callback(process, timeout)
+                with trace.Span(
+                        'rc',
+                        'process',
+                        job=self.job_id,
+                        pid=process.pid):
+                    (out, error) = self.callback(process, timeout)
 
         except Exception as e:
             error = JobError(
                 JobError.EXCEPTION,
                 "Aborting with exception: {}".format(e))
 
+        # Never leave `stop` waiting for a process that did not start.
+        if not self.p.done():
+            self.p.set_result(None)
+
+        duration = time() - start_time
+        metrics.record(self.category(), 'total', duration)
+
         if not self.nodebug:
             log.debug("Output-length: {}".format(len(out)))
-            log.debug("Process job ran for {:2.5f} seconds".format(
-                time() - start_time))
+            log.debug("Process job ran for {:2.5f} seconds".format(duration))
 
         if error:
             log.error("Failed to run process job {} with error: {}"
@@ -191,11 +273,142 @@ class RTagsJob():
 
         return (self.job_id, out, error)
 
+    def streams(self):
+        # Streaming jobs `feed` on output lines and `finish` once done.
+        return False
+
+    def results(self, out, error):
+        return (self.job_id, out, error)
+
     def run(self):
-        return self.run_process()
+        (_, out, error) = self.run_process(self.RUN_TIMEOUT)
+        return self.results(out, error)
+
+
+class StreamingJob(RTagsJob):
+    """Job handing its output lines to a consumer as they arrive.
+
+    The consumer gets called on the worker thread with batches of raw
+    output lines. Returning `False` tells us it has seen enough - we then
+    stop reading and kill `rc`. The job result still carries all lines
+    read up to that point.
+    """
+    BATCH_INTERVAL = 0.1
+
+    def __init__(self, job_id, command_info, consumer, **kwargs):
+        super().__init__(job_id, command_info, **kwargs)
+        self.consumer = consumer
+        self.lines = []
+        self.batch = []
+        self.error = None
+        self.stopped = False
+        self.last_batch = time()
+
+    def streams(self):
+        return True
+
+    def communicate(self, process, timeout=None):
+        if not timeout:
+            timeout = self.timeout
+
+        if self.data:
+            process.stdin.write(self.data)
+        process.stdin.close()
+
+        # Reading lines blocks, so the timeout is enforced by killing.
+        killer = None
+        if timeout:
+            killer = Timer(timeout, process.kill)
+            killer.start()
+
+        try:
+            with metrics.Timer(self.category(), 'roundtrip'):
+                for line in iter(process.stdout.readline, b''):
+                    if not self.feed(line):
+                        break
+
+                if self.stopped or self.error:
+                    process.kill()
+
+                process.wait()
+        finally:
+            if killer:
+                killer.cancel()
+
+        with metrics.Timer(self.category(), 'decode'):
+            return self.finish(process.returncode)
+
+    def feed(self, line):
+        line = line.rstrip(b'\r\n')
+
+        # Errors are reported as the one and only line.
+        if not self.lines and not self.batch:
+            self.error = JobError.from_results(line.decode('utf-8') + '\n')
+            if self.error:
+                return False
+
+        self.batch.append(line)
+
+        if time() - self.last_batch >= StreamingJob.BATCH_INTERVAL:
+            self.flush()
+
+        return not self.stopped
+
+    def flush(self):
+        self.lines.extend(self.batch)
+        self.stopped = self.consumer(self.batch) is False
+        self.batch = []
+        self.last_batch = time()
+
+        if self.stopped:
+            log.debug("Consumer of job {} has seen enough".format(
+                self.job_id))
+
+    def finish(self, returncode):
+        if self.batch and not self.stopped and not self.error:
+            self.flush()
+
+        if not self.error and not self.stopped and returncode != 0:
+            # Whatever `rc` had to say is the best hint at what failed.
+            self.error = JobError.from_results(
+                b'\n'.join(self.lines).decode('utf-8', 'replace'),
+                returncode)
+
+        return b'\n'.join(self.lines), self.error
 
 
-class CompletionJob(RTagsJob):
+class Completion():
+    """A single completion result, rendered on demand."""
+
+    def __init__(self, name, line):
+        # Symbol name to filter by.
+        self.name = name
+        self.line = line
+        self.rendered = None
+
+    @staticmethod
+    def parse(line):
+        elements = line.split(None, 1)
+        if not elements:
+            return None
+        return Completion(elements[0].decode('utf-8', 'replace'), line)
+
+    def render(self):
+        if not self.rendered:
+            self.rendered = CompletionJob.render(self.line)
+        return self.rendered
+
+
+class CompletionJob(StreamingJob):
+    """Completion query, reading at most `max_results` results.
+
+    Results get parsed as they arrive, no further than needed for
+    filtering by their names. Rendering is up to `Completion.render`.
+    """
+    CHANNEL = 'completion'
+    RUN_TIMEOUT = 60
+    # Results are bound to the view that asked for them.
+    COALESCE = False
 
     def __init__(self,
                  completion_job_id,
@@ -204,7 +417,9 @@ class CompletionJob(RTagsJob):
                  size,
                  row,
                  col,
-                 view):
+                 view,
+                 max_results=0,
+                 **kwargs):
         command_info = []
 
         # Auto-complete switch.
@@ -221,15 +436,22 @@ class CompletionJob(RTagsJob):
         command_info.append('--synchronous-completions')
         command_info.append('--code-complete-include-macros')
 
-        # command_info.append('--max')
-        # command_info.append(MAX_FROM_DEFAULTS)
+        if max_results:
+            command_info.append('--max')
+            command_info.append(str(max_results))
 
-        super().__init__(
-            completion_job_id,
-            command_info,
-            **{'data': text, 'view': view})
+        kwargs.update(
+            {'data': text, 'view': view, 'channel': CompletionJob.CHANNEL})
+
+        super().__init__(completion_job_id, command_info, None, **kwargs)
 
-    def render(self, line):
+        self.max_results = max_results
+        self.completions = []
+        # Seconds spent parsing results as they arrived.
+        self.parsing = 0.0
+
+    @staticmethod
+    def render(line):
         # Line is like this
         #  "process void process(CompletionThread::Request *request) CXXMethod"
         #  "reparseTime int reparseTime VarDecl"
@@ -279,20 +501,59 @@ class CompletionJob(RTagsJob):
 
         return display, completion
 
-    def run(self):
-        (job_id, out, error) = self.run_process(60)
+    def feed(self, line):
+        line = line.rstrip(b'\r\n')
+
+        # Errors are reported as the one and only line.
+        if not self.completions:
+            self.error = JobError.from_results(line.decode('utf-8') + '\n')
+            if self.error:
+                return False
+
+        start_time = time()
+        completion = Completion.parse(line)
+        self.parsing += time() - start_time
+
+        if completion:
+            self.completions.append(completion)
+
+        if self.max_results and len(self.completions) >= self.max_results:
+            log.debug("Completion job {} read {} results, enough".format(
+                self.job_id,
+                len(self.completions)))
+            self.stopped = True
+            return False
+
+        return True
+
+    def finish(self, returncode):
+        if not self.error and not self.stopped:
+            self.error = JobError.from_results('', returncode)
+
+        if not self.error:
+            metrics.record(self.category(), 'parse', self.parsing)
+
+        return b'', self.error
 
-        suggestions = []
+    def results(self, out, error):
+        completions = []
 
         if not error:
-            for line in out.splitlines():
-                display, render = self.render(line)
-                suggestions.append((display, render))
+            completions = self.completions
 
-        return (job_id, suggestions, error, self.view)
+        return (self.job_id, completions, error, self.view)
+
+
+class CompletionWarmUpJob(CompletionJob):
+    """Completion query only having `rdm` parse the file ahead of time.
+
+    Its metrics are kept apart from those of real completions.
+    """
 
 
 class ReindexJob(RTagsJob):
+    LANE = 'background'
+    RUN_TIMEOUT = 300
 
     def __init__(self, job_id, filename, text=b'', view=None):
         command_info = ["-V", filename]
@@ -302,175 +563,499 @@ class ReindexJob(RTagsJob):
 
         super().__init__(job_id, command_info, **{'data': text, 'view': view})
 
-    def run(self):
-        return self.run_process(300)
 
+class BatchReindexJob(RTagsJob):
+    """Reindexes files as saved, all of them through a single `rc`."""
+    LANE = 'background'
+    RUN_TIMEOUT = 300
+
+    def __init__(self, job_id, filenames):
+        command_info = []
+        for filename in filenames:
+            command_info += ["-V", filename]
+
+        super().__init__(job_id, command_info)
 
-class MonitorJob(RTagsJob):
 
-    def __init__(self, job_id):
+class MonitorJob(RTagsJob):
+    LANE = 'monitor'
+    COALESCE = False
+    CHUNK_SIZE = 64 * 1024
+
+    MAPPING = {
+        'warning': 'warning',
+        'error': 'error',
+        'fixit': 'error'
+    }
+
+    def __init__(self, job_id, consumer, progress=None):
+        # Monitoring goes on for as long as we need it.
         super().__init__(
             job_id,
             ['--json', '-m'],
-            **{'communicate': self.communicate})
+            **{'communicate': self.communicate, 'timeout': None})
+        # Gets called with the filename and issues of every file checked.
+        self.consumer = consumer
+        # Gets called with the index and total of indexing jobs done.
+        self.progress = progress
+        self.stream = jsonstream.JSONStream()
+        self.error = None
 
     def run(self):
         log.debug("Running MonitorJob process NOW...")
         return self.run_process()
 
+    def streams(self):
+        return True
+
     def communicate(self, process, timeout=None):
         log.debug("In data callback {}".format(process.stdout))
 
-        buffer = ''  # JSON to be parsed
+        # Whatever is available gets decoded right away, diagnostics
+        # dumps may take megabytes.
+        read = partial(process.stdout.read1, MonitorJob.CHUNK_SIZE)
 
-        brackets_open = 0
+        for data in iter(read, b''):
+            if not self.feed(data):
+                break
 
-        mapping = {
-            'warning': 'warning',
-            'error': 'error',
-            'fixit': 'error'
-        }
+            if process.poll():
+                log.debug("Process has terminated")
+                break
 
-        display_types = settings.get('validation_display_types')
+        log.debug("Data callback terminating")
+
+        return self.finish(process.returncode)
 
-        for line in iter(process.stdout.readline, b''):
-            line = line.decode('utf-8')
+    def feed(self, data):
+        # Errors come as plain text, outside of any JSON value.
+        if not self.stream.depth:
+            self.error = JobError.from_results(
+                data.decode('utf-8', errors='replace'))
+            if self.error:
+                return False
 
-            brackets_open += line.count('{')
-            brackets_open -= line.count('}')
+        for dictionary in self.stream.feed(data):
+            log.debug("JSON dump dictionary: {}".format(dictionary))
 
-            # Keep on accumulating JSON object data until its end.
-            buffer += line
+            self.dispatch(dictionary)
 
-            error = JobError.from_results(line)
-            if error:
-                return (b'', error)
+        return True
 
-            if brackets_open <= 0:
-                dictionary = json.loads(buffer)
+    def finish(self, returncode):
+        return (b'', self.error)
 
-                log.debug("JSON dump dictionary: {}".format(dictionary))
+    def dispatch(self, dictionary):
+        mapping = MonitorJob.MAPPING
 
-                if 'checkStyle' in dictionary:
-                    checkstyle = dictionary['checkStyle']
+        display_types = settings.get('validation_display_types')
 
-                    issues = {
-                        'warning': [],
-                        'error': [],
-                        'note': []
-                    }
+        if dictionary.get('type') == 'progress':
+            if self.progress:
+                self.progress(
+                    int(dictionary['index']),
+                    int(dictionary['total']))
+            return
 
-                    for file in checkstyle.keys():
-                        for error in checkstyle[file]:
-                            if not error['type'] in mapping.keys():
-                                log.debug("Unexpected diagnostics type {}"
-                                          .format(error['type']))
-                                continue
-                            if not mapping[error['type']] in display_types:
-                                log.debug("Skipping validation type {}"
-                                          .format(mapping[error['type']]))
+        if 'checkStyle' in dictionary:
+            checkstyle = dictionary['checkStyle']
+
+            # Anything we know about these files is outdated now.
+            for file in checkstyle.keys():
+                JobController.cache.invalidate(file)
+
+            for file in checkstyle.keys():
+                issues = {
+                    'warning': [],
+                    'error': [],
+                    'note': []
+                }
+
+                for error in checkstyle[file]:
+                    if not error['type'] in mapping.keys():
+                        log.debug("Unexpected diagnostics type {}"
+                                  .format(error['type']))
+                        continue
+                    if not mapping[error['type']] in display_types:
+                        log.debug("Skipping validation type {}"
+                                  .format(mapping[error['type']]))
+                        continue
+                    issue = {}
+                    issue['type'] = mapping[error['type']]
+                    issue['line'] = int(error['line'])
+                    issue['column'] = int(error['column'])
+                    if 'length' in error.keys():
+                        issue['length'] = int(error['length'])
+                    issue['message'] = error['message']
+                    issue['subissues'] = []
+
+                    if 'note' in display_types and 'children' in error.keys():
+                        for child in error['children']:
+                            if not child['type'] == 'note':
+                                log.warning(
+                                    "Ignoring subissue type {}".format(
+                                        child['type']))
                                 continue
-                            issue = {}
-                            issue['type'] = mapping[error['type']]
-                            issue['line'] = int(error['line'])
-                            issue['column'] = int(error['column'])
-                            if 'length' in error.keys():
-                                issue['length'] = int(error['length'])
-                            issue['message'] = error['message']
-                            issue['subissues'] = []
-
-                            if 'note' in display_types and 'children' in error.keys():
-                                for child in error['children']:
-                                    if not child['type'] == 'note':
-                                        log.warning(
-                                            "Ignoring subissue type {}".format(
-                                                child['type']))
-                                        continue
-
-                                    context_file = file
-                                    if 'file' in child:
-                                        context_file = child['file']
-                                    context_line = int(child['line'])
-                                    context_column = int(child['column'])
-                                    context_length = 0
-                                    if 'length' in child.keys():
-                                        context_length = int(child['length'])
-
-                                    message = child['message']
-                                    context = ""
-
-                                    if context_line > 0:
-                                        if context_file == file:
-                                            context = tools.Utilities.file_content(
-                                                context_file,
-                                                context_line)
-                                            message += "\n\a{}\b".format(context.strip())
-                                        else:
-                                            context = tools.Utilities.file_content(
-                                                context_file,
-                                                context_line)
-                                            message += " \v{}\f\n\a{}\b".format(
-                                                context_file,
-                                                context.strip())
-
-                                    subissue = {}
-                                    subissue['type'] = 'note'
-                                    subissue['file'] = context_file
-                                    subissue['line'] = context_line
-                                    subissue['column'] = context_column
-                                    subissue['message'] = message
-                                    subissue['length'] = context_length
-
-                                    issue['subissues'].append(subissue)
-
-                            issues[mapping[error['type']]].append(issue)
-
-                        log.debug("Triggering fixits update")
-
-                        sublime.active_window().active_view().run_command(
-                            'rtags_fixit',
-                            {
-                                'filename': file,
-                                'issues': issues
-                            })
-
-                buffer = ''
 
-            if process.poll():
-                log.debug("Process has terminated")
+                            context_file = file
+                            if 'file' in child:
+                                context_file = child['file']
+                            context_line = int(child['line'])
+                            context_column = int(child['column'])
+                            context_length = 0
+                            if 'length' in child.keys():
+                                context_length = int(child['length'])
+
+                            message = child['message']
+                            context = ""
+
+                            if context_line > 0:
+                                if context_file == file:
+                                    context = tools.Utilities.file_content(
+                                        context_file,
+                                        context_line)
+                                    message += "\n\a{}\b".format(
+                                        context.strip())
+                                else:
+                                    context = tools.Utilities.file_content(
+                                        context_file,
+                                        context_line)
+                                    message += " \v{}\f\n\a{}\b".format(
+                                        context_file,
+                                        context.strip())
+
+                            subissue = {}
+                            subissue['type'] = 'note'
+                            subissue['file'] = context_file
+                            subissue['line'] = context_line
+                            subissue['column'] = context_column
+                            subissue['message'] = message
+                            subissue['length'] = context_length
+
+                            issue['subissues'].append(subissue)
+
+                    issues[mapping[error['type']]].append(issue)
+
+                log.debug("Triggering fixits update")
+
+                self.consumer(file, issues)
+
+
+class ResultCache():
+    """Size-bounded LRU cache of idempotent query results.
+
+    Entries are keyed by the query switches, the queried file and its
+    buffer version. Results of file scoped queries (e.g. symbol info)
+    only depend on the index of that file, project scoped ones (e.g.
+    references) on the entire index. Only the monitor tells about the
+    indexing of other files, hence project scoped results are cached
+    only while it runs.
+    """
+    FILE = 'file'
+    PROJECT = 'project'
+
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.monitored = False
+        self.lock = RLock()
+
+    def monitoring(self, running):
+        """Tell whether the monitor is running, called by the monitor."""
+        with self.lock:
+            self.monitored = running
+
+            if running:
+                return
+
+            # Whatever gets indexed from now on goes unnoticed.
+            for key in list(self.entries.keys()):
+                (_, scope, _) = self.entries[key]
+                if scope == ResultCache.PROJECT:
+                    del self.entries[key]
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
 
-                return (b'', None)
+            self.hits += 1
+            self.entries.move_to_end(key)
+            (_, _, result) = self.entries[key]
+            return result
+
+    def put(self, key, scope, result):
+        size = int(settings.get('result_cache_size', 256))
+
+        with self.lock:
+            if scope == ResultCache.PROJECT and not self.monitored:
+                return
+
+            self.entries[key] = (key[1], scope, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, filename=None):
+        # Reindexing a file may change anything project scoped.
+        with self.lock:
+            for key in list(self.entries.keys()):
+                (file, scope, _) = self.entries[key]
+                if (not filename or
+                        file == filename or
+                        scope == ResultCache.PROJECT):
+                    del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class Lane():
+    """Scheduling class with a capacity of its own.
+
+    Jobs get queued per owning view and are dispatched round-robin
+    across those views, so a single busy view can not monopolize a lane.
+    """
+    WAIT_SAMPLES = 100
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.pool = futures.ThreadPoolExecutor(max_workers=capacity)
+        self.queues = collections.OrderedDict()
+        self.running = 0
+        self.waits = collections.deque([], maxlen=Lane.WAIT_SAMPLES)
+        self.lock = RLock()
+
+    def depth(self):
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def submit(self, fn, owner=None):
+        future = futures.Future()
+
+        with self.lock:
+            if owner not in self.queues:
+                self.queues[owner] = collections.deque()
+            self.queues[owner].append((future, fn, time()))
+
+        self.dispatch()
 
-        log.debug("Data callback terminating")
+        return future
 
-        return (b'', None)
+    def dispatch(self):
+        with self.lock:
+            while self.running < self.capacity and self.queues:
+                (owner, queue) = next(iter(self.queues.items()))
+                (future, fn, queued) = queue.popleft()
+
+                # Move the owner to the end of the line.
+                del self.queues[owner]
+                if queue:
+                    self.queues[owner] = queue
+
+                if future.cancelled():
+                    continue
+
+                self.running += 1
+                self.waits.append(time() - queued)
+                self.pool.submit(self.execute, future, fn)
+
+    def execute(self, future, fn):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn())
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.dispatch()
+
+    def stats(self):
+        with self.lock:
+            waits = list(self.waits)
+            return {
+                'lane': self.name,
+                'capacity': self.capacity,
+                'running': self.running,
+                'queued': self.depth(),
+                'wait_mean': sum(waits) / len(waits) if waits else 0.0,
+                'wait_max': max(waits) if waits else 0.0
+            }
 
 
 class JobController():
-    pool = futures.ThreadPoolExecutor(max_workers=4)
+    LANE_CAPACITIES = {
+        'interactive': 3,
+        'background': 2,
+        'monitor': 1
+    }
+
+    lanes = {}
     lock = RLock()
     thread_map = {}
+    generations = {}
+    channels = {}
+    reaper = futures.ThreadPoolExecutor(max_workers=1)
+    cache = ResultCache()
+    inflight = {}
+    engine_type = None
+    engine_instance = None
     unique_index = 0
 
+    @staticmethod
+    def engine():
+        engine_type = settings.get('job_engine', 'threads')
+
+        with JobController.lock:
+            if engine_type == JobController.engine_type:
+                return JobController.engine_instance
+
+            if JobController.engine_instance:
+                JobController.engine_instance.close()
+                JobController.engine_instance = None
+
+            JobController.engine_type = engine_type
+
+            if engine_type == 'asyncio':
+                try:
+                    from . import engine
+                    JobController.engine_instance = engine.AsyncioEngine()
+                except (ImportError, SyntaxError) as e:
+                    log.error("Asyncio job engine not available, falling"
+                              " back to threads: {}".format(e))
+            elif engine_type != 'threads':
+                log.warning("Unknown job engine {}, using threads".format(
+                    engine_type))
+
+            return JobController.engine_instance
+
+    @staticmethod
+    def lane(name):
+        with JobController.lock:
+            if name not in JobController.LANE_CAPACITIES:
+                log.warning("Unknown lane {}, using interactive".format(name))
+                name = 'interactive'
+
+            if name not in JobController.lanes:
+                capacities = settings.get('job_lanes', {})
+                capacity = capacities.get(
+                    name,
+                    JobController.LANE_CAPACITIES[name])
+                JobController.lanes[name] = Lane(name, max(1, int(capacity)))
+
+            return JobController.lanes[name]
+
+    @staticmethod
+    def lane_stats():
+        with JobController.lock:
+            lanes = list(JobController.lanes.values())
+        return [lane.stats() for lane in lanes]
+
     @staticmethod
     def next_id():
         JobController.unique_index += 1
         return "{}".format(JobController.unique_index)
 
+    @staticmethod
+    def cached(job, callback):
+        key = job.cache_key()
+        if not key:
+            return None
+
+        result = JobController.cache.get(key)
+        if not result:
+            return None
+
+        log.debug("Serving job {} from cache".format(job.job_id))
+
+        future = futures.Future()
+        future.set_result(result)
+
+        if callback:
+            callback(future)
+
+        return future
+
     @staticmethod
     def run_async(job, callback=None, indicator=None):
-        future = None
+        future = JobController.cached(job, callback)
+        if future:
+            return future
+
         with JobController.lock:
             if job.job_id in JobController.thread_map.keys():
                 log.debug("Job {} still active".format(job.job_id))
                 return None
 
-            log.debug("Starting async job {}".format(job.job_id))
+            lane = JobController.lane(job.lane)
+
+            log.debug("Queueing async job {} in lane {} at depth {}".format(
+                job.job_id,
+                lane.name,
+                lane.depth()))
 
             if indicator:
                 indicator.start()
 
-            future = JobController.pool.submit(job.run)
+            superseded = None
+            if job.channel:
+                key = (job.owner(), job.channel)
+                superseded = JobController.channels.get(key)
+                job.generation = JobController.generations.get(key, 0) + 1
+                JobController.generations[key] = job.generation
+                JobController.channels[key] = job.job_id
+
+            leader = JobController.leader(job)
+
+            if leader:
+                (future, _) = JobController.thread_map[leader.job_id]
+
+                log.debug("Coalescing job {} with in-flight job {}".format(
+                    job.job_id,
+                    leader.job_id))
+
+                trace.instant(
+                    'coalesce',
+                    'job',
+                    job=job.job_id,
+                    leader=leader.job_id,
+                    view=job.owner())
+
+                # Stopping this job stops the shared process.
+                job.leader = leader
+                job.p = leader.p
+                leader.followers.append(job)
+            else:
+                trace.instant(
+                    'submit',
+                    'job',
+                    job=job.job_id,
+                    lane=lane.name,
+                    view=job.owner())
+
+                job.queued_at = time()
+
+                engine = JobController.engine()
+                if engine:
+                    future = engine.run_async(job)
+                else:
+                    future = lane.submit(
+                        partial(JobController.execute, job),
+                        job.owner())
+
+                key = job.coalesce_key()
+                if key:
+                    JobController.inflight[key] = job.job_id
 
             # Push the future and job onto our thread-map.
             #
@@ -480,14 +1065,121 @@ class JobController():
             # the job is already done when we reach this point.
             JobController.thread_map[job.job_id] = (future, job)
 
+        if superseded:
+            JobController.cancel(superseded)
+
         if callback:
-            future.add_done_callback(callback)
+            future.add_done_callback(
+                partial(JobController.deliver, job=job, callback=callback))
 
         future.add_done_callback(
             partial(JobController.done, job=job, indicator=indicator))
 
         return future
 
+    @staticmethod
+    def leader(job):
+        # An identical in-flight job that is still of use to anyone.
+        key = job.coalesce_key()
+        if not key or key not in JobController.inflight:
+            return None
+
+        job_id = JobController.inflight[key]
+        if job_id not in JobController.thread_map:
+            return None
+
+        (future, leader) = JobController.thread_map[job_id]
+        if future.done():
+            return None
+
+        if leader.abandoned():
+            return None
+
+        return leader
+
+    @staticmethod
+    def execute(job):
+        with trace.Span(
+                job.job_id,
+                'job',
+                lane=job.lane,
+                view=job.owner()):
+            return job.run()
+
+    @staticmethod
+    def current(job):
+        if job.cancelled:
+            return False
+
+        if not job.channel:
+            return True
+
+        with JobController.lock:
+            return job.generation == JobController.generations.get(
+                (job.owner(), job.channel))
+
+    @staticmethod
+    def deliver(future, job, callback):
+        # Late results of superseded or cancelled jobs are of no use.
+        if not JobController.current(job):
+            log.debug("Dropping result of superseded job {}".format(
+                job.job_id))
+            return
+
+        callback(future)
+
+    @staticmethod
+    def supersede(view, channel):
+        with JobController.lock:
+            key = (view.id(), channel)
+            JobController.generations[key] = \
+                JobController.generations.get(key, 0) + 1
+            job_id = JobController.channels.pop(key, None)
+
+        if job_id:
+            JobController.cancel(job_id)
+
+    @staticmethod
+    def cancel(job_id):
+        # Unlike `stop`, this returns right away. The subprocess gets
+        # killed on the reaper thread, any late result gets dropped.
+        with JobController.lock:
+            if job_id not in JobController.thread_map.keys():
+                log.debug("Job {} not active".format(job_id))
+                return
+            (future, job) = JobController.thread_map[job_id]
+
+            # Finished jobs are just about delivering their results,
+            # those are still good.
+            if future.done():
+                log.debug("Job {} already finished".format(job_id))
+                return
+
+            job.cancelled = True
+
+            leader = job.leader or job
+            shared = [member for member in [leader] + leader.followers
+                      if not member.cancelled]
+
+        log.debug("Cancelling job {}".format(job_id))
+
+        trace.instant('cancel', 'job', job=job_id, view=job.owner())
+
+        # Others still waiting on the shared process keep it running.
+        if shared:
+            log.debug("Job {} still shared with {}".format(
+                leader.job_id,
+                [member.job_id for member in shared]))
+            return
+
+        job = leader
+
+        # Jobs still waiting in their lane never get to run at all.
+        if future.cancel():
+            return
+
+        JobController.reaper.submit(job.stop)
+
     @staticmethod
     def run_sync(job, timeout=None):
         # Debug logging every single run_sync request is too verbose
@@ -531,6 +1223,18 @@ class JobController():
     def done(future, job, indicator):
         log.debug("Job {} done".format(job.job_id))
 
+        trace.instant(
+            'finish',
+            'job',
+            job=job.job_id,
+            view=job.owner(),
+            cancelled=future.cancelled())
+
+        key = job.cache_key()
+        if key and not job.cancelled and not future.cancelled():
+            if not future.exception() and not future.result()[2]:
+                JobController.cache.put(key, job.cache_scope, future.result())
+
         if not future.done():
             log.debug("Job wasn't really done")
 
@@ -541,6 +1245,15 @@ class JobController():
             indicator.stop()
 
         with JobController.lock:
+            if job.channel:
+                key = (job.owner(), job.channel)
+                if JobController.channels.get(key) == job.job_id:
+                    del JobController.channels[key]
+
+            key = job.coalesce_key()
+            if key and JobController.inflight.get(key) == job.job_id:
+                del JobController.inflight[key]
+
             if job.job_id in JobController.thread_map:
                 del JobController.thread_map[job.job_id]
                 log.debug("Removed bookkeeping for job {}".format(job.job_id))
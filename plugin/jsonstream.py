@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""JSON Stream.
+
+Incremental decoder for a stream of concatenated JSON values, like the
+one `rc -m` keeps sending.
+
+"""
+
+import json
+import logging
+import re
+
+log = logging.getLogger("RTags")
+
+
+class JSONStream():
+    """Decodes top-level JSON objects and arrays as they complete.
+
+    New data gets scanned only once, for its brackets outside of strings,
+    so braces within messages do no harm. Once the brackets tell that a
+    value is complete, it is decoded in one go.
+
+    Scanning works on complete lines of raw bytes; strings never span
+    lines, and structural characters are plain ASCII that is never part
+    of a multi-byte utf-8 sequence. Lines without any closing bracket
+    cannot complete a value, their scan waits for one that can.
+    """
+    # Anything up to the next bracket.
+    SKIP = re.compile(br'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+
+    OPENING = re.compile(br'[\[{]')
+
+    # Reduces data to its brackets and quotes, all brackets curly.
+    BRACKETS = bytes.maketrans(b'[]', b'{}')
+    NOISE = bytes(c for c in range(256) if c not in b'[]{}"')
+
+    # Bytes scanned at first for the end of a value, doubling until it
+    # is found. Values closing early within many lines need not wait for
+    # the scan of all of them.
+    WINDOW = 4 * 1024
+
+    # Bytes consumed before they get dropped from the buffer.
+    COMPACT = 64 * 1024
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buffer = bytearray()
+        # Offset of the value at hand, or of the data not consumed yet.
+        self.start = 0
+        # Offset of the next byte to scan.
+        self.position = 0
+        # Nesting depth of the value at hand, up to the scan position.
+        self.depth = 0
+        # Closing brackets within the data not scanned yet, strings
+        # included. Fewer of them than the depth cannot close the value.
+        self.closing = 0
+
+    def pending(self):
+        return len(self.buffer) - self.start
+
+    def feed(self, data):
+        """Add data and return all values completed by it."""
+        self.buffer += data
+
+        closing = self.closing + data.count(b'}') + data.count(b']')
+        self.closing = closing
+
+        if closing < self.depth or (self.depth and b'\n' not in data):
+            return []
+
+        values = self.scan()
+
+        # Consumed data gets dropped once in a while only.
+        if self.start == len(self.buffer):
+            del self.buffer[:]
+            self.start = 0
+            self.position = 0
+        elif self.start > JSONStream.COMPACT:
+            del self.buffer[:self.start]
+            self.position -= self.start
+            self.start = 0
+
+        self.closing = self.buffer.count(b'}', self.position) + \
+            self.buffer.count(b']', self.position)
+
+        return values
+
+    def scan(self):
+        """Scan complete lines and decode all values closed within."""
+        end = self.buffer.rfind(b'\n', self.position) + 1
+
+        values = []
+        text = None
+        window = JSONStream.WINDOW
+        attempt = False
+
+        while True:
+            if not self.depth:
+                match = JSONStream.OPENING.search(self.buffer, self.position)
+
+                if not match:
+                    # Anything in between top-level values is dropped.
+                    self.start = len(self.buffer)
+                    self.position = self.start
+                    return values
+
+                self.start = match.start()
+                self.position = self.start + 1
+                self.depth = 1
+                window = JSONStream.WINDOW
+
+                # Values complete within the lines at hand, like most of
+                # them, get decoded right away, without any scan.
+                attempt = True
+
+            # Wait for the rest of any line cut short.
+            if self.position >= end:
+                return values
+
+            if not attempt:
+                stop = self.buffer.find(
+                    b'\n',
+                    self.position + window,
+                    end) + 1 or end
+
+                if not self.closes(stop):
+                    if stop == end:
+                        return values
+
+                    window *= 2
+                    continue
+
+            # All values within the lines at hand get decoded from the
+            # same text, as long as its offsets match those of the buffer.
+            if text is None:
+                offset = self.start
+                text = self.buffer[offset:end].decode(
+                    'utf-8',
+                    'surrogateescape')
+                exact = len(text) == end - offset
+
+            try:
+                (value, size) = self.decode(text, self.start - offset, exact)
+            except ValueError as e:
+                if attempt:
+                    # Incomplete or broken, the scan tells.
+                    attempt = False
+                    continue
+
+                log.warning("Dropping undecodable JSON value: {}".format(e))
+                (value, size) = (None, self.measure(end))
+
+            attempt = False
+
+            if not exact:
+                text = None
+
+            if value is not None:
+                values.append(value)
+
+            self.start += size
+            self.position = self.start
+            self.depth = 0
+
+    def closes(self, end):
+        """Check if the open value gets closed before `end`.
+
+        If not, the scan position moves on to `end`.
+        """
+        brackets = JSONStream.brackets(self.buffer[self.position:end])
+
+        closing = brackets.count(b'}')
+
+        if closing >= self.depth:
+            # Matching pairs cancel out, leaving closing brackets
+            # followed by opening ones.
+            while b'{}' in brackets:
+                brackets = brackets.replace(b'{}', b'')
+
+            closing = brackets.count(b'}')
+
+            if closing >= self.depth:
+                return True
+
+        self.depth += len(brackets) - 2 * closing
+        self.position = end
+
+        return False
+
+    @staticmethod
+    def brackets(data):
+        """All brackets outside of strings, curly ones only."""
+        # Escaped quotes do not end a string.
+        if b'\\' in data:
+            data = data.replace(b'\\\\', b'').replace(b'\\"', b'')
+
+        data = data.translate(JSONStream.BRACKETS, JSONStream.NOISE)
+
+        # Strings without any brackets go first, in one sweep. Dropping
+        # adjacent quotes keeps all others paired as they are.
+        data = data.replace(b'""', b'')
+
+        if b'"' not in data:
+            return data
+
+        # Every other part is the inside of a string.
+        return b''.join(data.split(b'"')[0::2])
+
+    def decode(self, text, index, exact):
+        """Decode the value at `index` of `text`.
+
+        Returns the value and its size in bytes, `exact` telling that
+        characters and bytes match.
+        """
+        (value, stop) = self.decoder.raw_decode(text, index)
+
+        if exact:
+            return (value, stop - index)
+
+        size = len(text[index:stop].encode('utf-8', 'surrogateescape'))
+
+        return (value, size)
+
+    def measure(self, end):
+        """Size of the value at hand, by its brackets."""
+        depth = 0
+        position = self.start
+
+        while position < end:
+            position = JSONStream.SKIP.match(
+                self.buffer,
+                position,
+                end).end()
+
+            if position >= end:
+                break
+
+            token = self.buffer[position]
+            position += 1
+
+            if token in b'[{':
+                depth += 1
+            elif token in b']}':
+                depth -= 1
+
+            if not depth:
+                break
+
+        return position - self.start
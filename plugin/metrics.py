@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""Metrics.
+
+Latency histograms for every kind of job and each of its phases.
+
+"""
+
+import json
+import logging
+import math
+import re
+
+from threading import RLock
+from time import time
+
+log = logging.getLogger("RTags")
+
+
+# Phases of a job, in the order they happen.
+PHASES = ['queue', 'spawn', 'roundtrip', 'decode', 'parse', 'render', 'total']
+
+PERCENTILES = [50, 95, 99]
+
+
+class Histogram():
+    """Latency histogram of fixed size.
+
+    Bucket boundaries grow exponentially, so memory stays constant while
+    the relative error of any reported percentile stays below `GROWTH`.
+    """
+    MIN_VALUE = 0.00001
+    GROWTH = 1.2
+    BUCKETS = 100
+
+    def __init__(self):
+        self.buckets = [0] * Histogram.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def index(self, value):
+        if value <= Histogram.MIN_VALUE:
+            return 0
+
+        index = int(math.ceil(
+            math.log(value / Histogram.MIN_VALUE, Histogram.GROWTH)))
+
+        return min(index, Histogram.BUCKETS - 1)
+
+    def record(self, value):
+        self.buckets[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                upper = Histogram.MIN_VALUE * Histogram.GROWTH ** index
+                return min(upper, self.maximum)
+
+        return self.maximum
+
+    def summary(self):
+        result = {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.maximum
+        }
+        for percent in PERCENTILES:
+            result['p{}'.format(percent)] = self.percentile(percent)
+        return result
+
+
+class Timer():
+    """Records the time spent within a `with` block."""
+
+    def __init__(self, category, phase):
+        self.category = category
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, *args):
+        record(self.category, self.phase, time() - self.start)
+        return False
+
+
+lock = RLock()
+histograms = {}
+
+
+def category(job_id):
+    """Strip the unique index off a job id, e.g. `RTFollowSymbolJob42`."""
+    return re.sub(r'\d+$', '', job_id)
+
+
+def record(category, phase, seconds):
+    with lock:
+        key = (category, phase)
+        if key not in histograms:
+            histograms[key] = Histogram()
+        histograms[key].record(seconds)
+
+
+def reset():
+    global histograms
+
+    with lock:
+        histograms = {}
+
+
+def report():
+    """Summaries by category and phase."""
+    result = {}
+
+    with lock:
+        for (category, phase), histogram in histograms.items():
+            if category not in result:
+                result[category] = {}
+            result[category][phase] = histogram.summary()
+
+    return result
+
+
+def as_json(extra=None):
+    data = {'metrics': report()}
+    if extra:
+        data.update(extra)
+    return json.dumps(data, indent=2, sort_keys=True)
+
+
+def as_text():
+    lines = []
+
+    header = "{:<28} {:<10} {:>7} {:>10} {:>10} {:>10} {:>10}".format(
+        "job", "phase", "count", "p50 ms", "p95 ms", "p99 ms", "max ms")
+    lines.append(header)
+    lines.append("-" * len(header))
+
+    data = report()
+
+    def order(phase):
+        if phase in PHASES:
+            return PHASES.index(phase)
+        return len(PHASES)
+
+    for category in sorted(data.keys()):
+        for phase in sorted(data[category].keys(), key=order):
+            summary = data[category][phase]
+            lines.append(
+                "{:<28} {:<10} {:>7} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}"
+                .format(
+                    category,
+                    phase,
+                    summary['count'],
+                    summary['p50'] * 1000.0,
+                    summary['p95'] * 1000.0,
+                    summary['p99'] * 1000.0,
+                    summary['max'] * 1000.0))
+
+    return "\n".join(lines)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""Monitor.
+
+Keeps a single `rc -m` process per `rdm` running and routes the
+diagnostics it reports to the view-controllers of the files in question.
+
+"""
+
+import sublime
+
+import logging
+
+from functools import partial
+from threading import RLock
+from threading import Timer
+from time import time
+
+from . import diagnostics
+from . import jobs
+from . import settings
+from . import vc_manager
+from . import watchdog
+
+log = logging.getLogger("RTags")
+
+
+class Monitor():
+    JOB_ID = "RTMonitorJob"
+
+    # Seconds to wait before restarting a terminated monitor, doubling
+    # with every failed attempt.
+    MIN_BACKOFF = 0.5
+    MAX_BACKOFF = 30.0
+
+    lock = RLock()
+    running = False
+    socket = None
+    job = None
+    timer = None
+    backoff = MIN_BACKOFF
+    started_at = 0
+
+    @staticmethod
+    def start():
+        socket = settings.get('rdm_socket', "")
+
+        with Monitor.lock:
+            if Monitor.running and Monitor.socket == socket:
+                return
+
+        # A different `rdm` needs its own monitor.
+        Monitor.stop()
+
+        with Monitor.lock:
+            Monitor.running = True
+            Monitor.socket = socket
+            Monitor.backoff = Monitor.MIN_BACKOFF
+
+        log.debug("Starting monitor for rdm at '{}'".format(socket))
+
+        Monitor.launch()
+
+    @staticmethod
+    def stop():
+        with Monitor.lock:
+            Monitor.running = False
+
+            if Monitor.timer:
+                Monitor.timer.cancel()
+                Monitor.timer = None
+
+            job = Monitor.job
+            Monitor.job = None
+
+        watchdog.service.monitoring(False)
+        jobs.JobController.cache.monitoring(False)
+
+        if job:
+            log.debug("Stopping monitor")
+            jobs.JobController.cancel(job.job_id)
+
+    @staticmethod
+    def launch():
+        with Monitor.lock:
+            Monitor.timer = None
+
+            if not Monitor.running:
+                return
+
+            job = jobs.MonitorJob(
+                Monitor.JOB_ID,
+                Monitor.dispatch,
+                watchdog.service.progress)
+
+            Monitor.job = job
+            Monitor.started_at = time()
+
+        future = jobs.JobController.run_async(
+            job,
+            partial(Monitor.terminated, job))
+
+        if not future:
+            # The former monitor did not quite finish yet.
+            Monitor.restart(job)
+            return
+
+        watchdog.service.monitoring(True)
+        jobs.JobController.cache.monitoring(True)
+
+    @staticmethod
+    def terminated(job, future):
+        error = None
+        if future.done() and not future.cancelled():
+            (_, _, error) = future.result()
+
+        log.warning("Monitor terminated{}".format(
+            ": {}".format(error.message) if error else ""))
+
+        # Have the watchdog poll until the monitor is back.
+        with Monitor.lock:
+            if Monitor.job is job:
+                watchdog.service.monitoring(False)
+                jobs.JobController.cache.monitoring(False)
+
+        Monitor.restart(job)
+
+    @staticmethod
+    def restart(job):
+        with Monitor.lock:
+            if not Monitor.running or Monitor.job is not job:
+                return
+
+            # A monitor that kept running for long enough was healthy,
+            # hence this is a fresh failure.
+            if time() - Monitor.started_at > Monitor.MAX_BACKOFF:
+                Monitor.backoff = Monitor.MIN_BACKOFF
+
+            delay = Monitor.backoff
+            Monitor.backoff = min(Monitor.backoff * 2, Monitor.MAX_BACKOFF)
+
+            log.debug("Restarting monitor in {} seconds".format(delay))
+
+            Monitor.timer = Timer(delay, Monitor.launch)
+            Monitor.timer.daemon = True
+            Monitor.timer.start()
+
+    @staticmethod
+    def dispatch(filename, issues):
+        # Called from the monitor thread.
+        diagnostics.store.put(filename, issues)
+
+        # Diagnostics of a file come with every indexing of it.
+        watchdog.service.indexed(filename)
+
+        sublime.set_timeout(partial(Monitor.deliver, filename, issues), 0)
+
+    @staticmethod
+    def deliver(filename, issues):
+        controllers = vc_manager.controllers_of(filename)
+
+        log.debug("Routing diagnostics of {} to {} view(s)".format(
+            filename,
+            len(controllers)))
+
+        for controller in controllers:
+            controller.fixits.update(filename, issues)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""Reindex Scheduler.
+
+Queues reindex requests by file, so that repeated requests for the same
+file collapse into one and bursts of them reach `rdm` in order.
+
+"""
+
+import sublime
+
+import collections
+import logging
+
+from functools import partial
+from threading import RLock
+
+from . import jobs
+from . import settings
+
+log = logging.getLogger("RTags")
+
+
+class Request():
+    """Reindexing of a file, as saved or with its unsaved contents."""
+
+    def __init__(self, filename, text=b'', view=None):
+        self.filename = filename
+        self.text = text
+        self.view = view
+
+
+class Scheduler():
+    """Reindexes files, latest request per file wins.
+
+    Requests wait in order of their first submission. A request for a
+    file that is still waiting replaces the former one in place. At most
+    `reindex_concurrency` reindex jobs are running at a time, each file
+    being part of one of them at most. Files reindexed as saved are
+    passed to `rdm` together, through a single `rc`.
+    """
+    # Files at most reindexed through a single `rc`.
+    BATCH_SIZE = 64
+
+    lock = RLock()
+    pending = collections.OrderedDict()
+    # Files being reindexed, as { filename => job_id }.
+    running = {}
+    scheduled = False
+
+    @staticmethod
+    def submit(filename, text=b'', view=None):
+        Scheduler.submit_batch([Request(filename, text, view)])
+
+    @staticmethod
+    def submit_batch(requests):
+        with Scheduler.lock:
+            for request in requests:
+                if request.filename in Scheduler.pending:
+                    log.debug("Coalescing reindex of {}".format(
+                        request.filename))
+
+                Scheduler.pending[request.filename] = request
+
+            # Requests submitted in one go on the main thread, like those
+            # of "save all", get dispatched together.
+            if Scheduler.scheduled:
+                return
+            Scheduler.scheduled = True
+
+        sublime.set_timeout_async(Scheduler.dispatch, 0)
+
+    @staticmethod
+    def concurrency():
+        return max(1, int(settings.get('reindex_concurrency', 2)))
+
+    @staticmethod
+    def take():
+        """Take the next batch of requests that may run now."""
+        batch = []
+
+        for filename, request in Scheduler.pending.items():
+            if filename in Scheduler.running:
+                continue
+
+            # Unsaved contents go through a request of their own.
+            if request.text:
+                if not batch:
+                    batch.append(request)
+                    break
+                continue
+
+            if batch and batch[0].text:
+                break
+
+            batch.append(request)
+
+            if len(batch) == Scheduler.BATCH_SIZE:
+                break
+
+        for request in batch:
+            del Scheduler.pending[request.filename]
+
+        return batch
+
+    @staticmethod
+    def dispatch():
+        started = []
+
+        with Scheduler.lock:
+            Scheduler.scheduled = False
+
+            while len(set(Scheduler.running.values())) < \
+                    Scheduler.concurrency():
+                batch = Scheduler.take()
+                if not batch:
+                    break
+
+                job_id = "RTReindexJob" + jobs.JobController.next_id()
+
+                if len(batch) == 1:
+                    job = jobs.ReindexJob(
+                        job_id,
+                        batch[0].filename,
+                        batch[0].text,
+                        batch[0].view)
+                else:
+                    job = jobs.BatchReindexJob(
+                        job_id,
+                        [request.filename for request in batch])
+
+                for request in batch:
+                    Scheduler.running[request.filename] = job_id
+
+                started.append((job, batch))
+
+        for (job, batch) in started:
+            log.debug("Reindexing {}".format(
+                [request.filename for request in batch]))
+
+            future = jobs.JobController.run_async(job)
+
+            if future:
+                future.add_done_callback(partial(Scheduler.finished, job))
+            else:
+                Scheduler.finished(job)
+
+    @staticmethod
+    def finished(job, future=None):
+        with Scheduler.lock:
+            for filename in [filename for filename, job_id
+                             in Scheduler.running.items()
+                             if job_id == job.job_id]:
+                del Scheduler.running[filename]
+
+            if not Scheduler.pending or Scheduler.scheduled:
+                return
+            Scheduler.scheduled = True
+
+        sublime.set_timeout_async(Scheduler.dispatch, 0)
+
+    @staticmethod
+    def stats():
+        with Scheduler.lock:
+            return {
+                'pending': len(Scheduler.pending),
+                'running': len(Scheduler.running)
+            }
+
+    @staticmethod
+    def clear():
+        with Scheduler.lock:
+            Scheduler.pending.clear()
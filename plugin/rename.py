@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""Rename.
+
+Renames a symbol across all files it occurs in, either entirely or not
+at all.
+
+"""
+
+import sublime
+
+import logging
+import os
+import shutil
+import tempfile
+
+from concurrent import futures
+
+from . import jobs
+from . import reindex
+from . import tools
+from . import vc_manager
+
+log = logging.getLogger("RTags")
+
+
+class RenameError(Exception):
+    pass
+
+
+class Prepared():
+    """A renamed file, written next to the original."""
+
+    def __init__(self, file, stamp, original, temp):
+        self.file = file
+        self.stamp = stamp
+        self.original = original
+        self.temp = temp
+
+
+class Rename():
+    """Renames a symbol, editing open buffers and files on disk.
+
+    Files that are not open get rewritten in parallel into temporary
+    files, which only replace the originals once all files and buffers
+    passed verification. Failing to move any of them into place restores
+    the ones already replaced.
+    """
+    WORKERS = 8
+
+    def __init__(self, old, new, mutations):
+        self.old = old
+        self.new = new
+        # Occurrences by file, as { file => { row => [col] } }.
+        self.mutations = mutations
+        self.views = {}
+        self.edits = {}
+
+    @staticmethod
+    def stamp(file):
+        stat = os.stat(file)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def run(self):
+        """Verify open buffers and start renaming, on the main thread."""
+        for window in sublime.windows():
+            for view in window.views():
+                file = view.file_name()
+                if file in self.mutations and file not in self.views:
+                    self.views[file] = view
+
+        try:
+            for file, view in self.views.items():
+                self.edits[file] = (
+                    view.change_count(),
+                    self.regions(view, self.mutations[file]))
+        except RenameError as e:
+            Rename.failed(e)
+            return
+
+        sublime.set_timeout_async(self.write, 0)
+
+    def regions(self, view, target_map):
+        regions = []
+
+        for row, cols in target_map.items():
+            line = view.substr(view.line(view.text_point(row - 1, 0)))
+            encoded = line.encode('utf-8')
+
+            for col in cols:
+                # Columns count bytes, buffer positions characters.
+                column = len(encoded[:col - 1].decode('utf-8', 'ignore'))
+                start = view.text_point(row - 1, column)
+
+                # We may have a leading '~' here.
+                if view.substr(start) == "~":
+                    start += 1
+
+                region = sublime.Region(start, start + len(self.old))
+
+                if view.substr(region) != self.old:
+                    raise RenameError(
+                        "Symbol name does not match at line {} column {}"
+                        " in {}".format(row, col, view.file_name()))
+
+                regions.append([region.a, region.b])
+
+        return regions
+
+    def prepare(self, file):
+        stamp = Rename.stamp(file)
+
+        with open(file, 'rb') as in_file:
+            original = in_file.read()
+
+        # Splitting at newlines only keeps line endings as they are.
+        file_lines = original.split(b'\n')
+
+        for row in self.mutations[file]:
+            if not 0 < row <= len(file_lines):
+                raise RenameError(
+                    "Line {} is out of range in {}".format(row, file))
+
+        mismatches = tools.Utilities.replace_in_lines(
+            self.old.encode('utf-8'),
+            self.new.encode('utf-8'),
+            file_lines,
+            self.mutations[file])
+
+        if mismatches:
+            (row, col) = mismatches[0]
+            raise RenameError(
+                "Symbol name does not match at line {} column {}"
+                " in {}".format(row, col, file))
+
+        (handle, temp) = tempfile.mkstemp(
+            prefix=".{}.".format(os.path.basename(file)),
+            dir=os.path.dirname(file))
+
+        try:
+            with os.fdopen(handle, 'wb') as out_file:
+                out_file.write(b'\n'.join(file_lines))
+
+            shutil.copymode(file, temp)
+        except Exception:
+            os.unlink(temp)
+            raise
+
+        return Prepared(file, stamp, original, temp)
+
+    def write(self):
+        """Rewrite all files that are not open, on a worker thread."""
+        files = [file for file in self.mutations if file not in self.views]
+
+        prepared = []
+        error = None
+
+        with futures.ThreadPoolExecutor(max_workers=Rename.WORKERS) as pool:
+            pending = [pool.submit(self.prepare, file) for file in files]
+
+            for future in pending:
+                # Whatever went wrong, no file must get changed.
+                try:
+                    prepared.append(future.result())
+                except Exception as e:
+                    error = error or e
+
+        if error:
+            Rename.discard(prepared)
+            Rename.failed(error)
+            return
+
+        committed = []
+
+        try:
+            for item in prepared:
+                if Rename.stamp(item.file) != item.stamp:
+                    raise RenameError("{} changed meanwhile".format(item.file))
+
+                os.replace(item.temp, item.file)
+                committed.append(item)
+        except (OSError, RenameError) as e:
+            Rename.discard(prepared[len(committed):])
+            Rename.restore(committed)
+            Rename.failed(e)
+            return
+
+        log.debug("Renamed {} in {} closed files".format(
+            self.old,
+            len(committed)))
+
+        sublime.set_timeout(lambda: self.edit(committed), 0)
+
+    def edit(self, committed):
+        """Edit all open buffers, on the main thread."""
+        for file, view in self.views.items():
+            (change_count, _) = self.edits[file]
+            if not view.is_valid() or view.change_count() != change_count:
+                Rename.restore(committed)
+                Rename.failed(RenameError("{} changed meanwhile".format(file)))
+                return
+
+        for file, view in self.views.items():
+            (_, regions) = self.edits[file]
+            view.run_command(
+                'rtags_replace_regions',
+                {
+                    'regions': regions,
+                    'text': self.new
+                })
+
+        files = [item.file for item in committed]
+
+        for file in files:
+            jobs.JobController.cache.invalidate(file)
+            tools.Utilities.lines.invalidate(file)
+
+        # All files on disk get reindexed in one ordered batch, open
+        # buffers along with their unsaved contents.
+        reindex.Scheduler.submit_batch(
+            [reindex.Request(file) for file in files])
+
+        for view in self.views.values():
+            vc_manager.view_controller(view).fixits.reindex(saved=False)
+
+        sublime.status_message("Renamed {} occurrence/s in {} file/s".format(
+            sum(len(cols) for rows in self.mutations.values()
+                for cols in rows.values()),
+            len(self.mutations)))
+
+    @staticmethod
+    def discard(prepared):
+        for item in prepared:
+            try:
+                os.unlink(item.temp)
+            except OSError as e:
+                log.warning("Failed to remove {}: {}".format(item.temp, e))
+
+    @staticmethod
+    def restore(committed):
+        for item in committed:
+            try:
+                with open(item.file, 'wb') as out_file:
+                    out_file.write(item.original)
+            except OSError as e:
+                log.error("Failed to restore {}: {}".format(item.file, e))
+
+    @staticmethod
+    def failed(error):
+        log.error("Rename aborted: {}".format(error))
+        sublime.set_timeout(
+            lambda: sublime.error_message(
+                "RTags rename aborted, no file got changed:\n\n{}".format(
+                    error)),
+            0)
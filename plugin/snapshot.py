@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""Buffer Snapshots.
+
+Hands out the utf-8 encoded contents of a view, encoding every version
+of a buffer only once. Completion, reindexing and navigation all share
+the very same bytes.
+
+"""
+
+import logging
+import sublime
+
+from threading import RLock
+
+log = logging.getLogger("RTags")
+
+
+lock = RLock()
+
+# Latest snapshot per view-id, as tuple (change count, bytes).
+snapshots = {}
+
+
+def text(view):
+    view_id = view.id()
+    version = view.change_count()
+
+    with lock:
+        snapshot = snapshots.get(view_id)
+
+    if snapshot and snapshot[0] == version:
+        return snapshot[1]
+
+    data = bytes(view.substr(sublime.Region(0, view.size())), "utf-8")
+
+    # Off the main thread, the buffer may have changed while we read it.
+    if view.change_count() != version:
+        return data
+
+    with lock:
+        snapshots[view_id] = (version, data)
+
+    log.debug("Encoded snapshot of view {} at version {}".format(
+        view_id,
+        version))
+
+    return data
+
+
+def forget(view):
+    with lock:
+        snapshots.pop(view.id(), None)
+
+
+def clear():
+    with lock:
+        snapshots.clear()
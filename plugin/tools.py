@@ -10,10 +10,15 @@ from os import path
 
 import logging
 
+import collections
 import html
 import imp
+import mmap
+import os
 import sys
 
+from threading import RLock
+
 PKG_NAME = path.basename(path.dirname(path.dirname(__file__)))
 
 if PKG_NAME.endswith(".sublime-package"):
@@ -45,9 +50,101 @@ class Reloader:
                 imp.reload(module)
 
 
+class LineIndex:
+    """Offsets of all lines within a file, for reading single lines.
+
+    Lines end with a newline character, a trailing carriage return is
+    dropped.
+    """
+    # Decoded lines kept per file.
+    MAX_LINES = 1024
+
+    def __init__(self, file, stamp):
+        self.file = file
+        self.stamp = stamp
+        self.size = stamp[1]
+        self.offsets = [0]
+        self.lines = {}
+
+        if self.size:
+            with open(file, 'rb') as in_file:
+                with mmap.mmap(
+                        in_file.fileno(),
+                        0,
+                        access=mmap.ACCESS_READ) as data:
+                    position = data.find(b'\n')
+                    while position != -1:
+                        self.offsets.append(position + 1)
+                        position = data.find(b'\n', position + 1)
+
+        # No line starts at the very end of the file.
+        if self.offsets[-1] == self.size:
+            self.offsets.pop()
+
+    def count(self):
+        return len(self.offsets)
+
+    def line(self, number):
+        if number in self.lines:
+            return self.lines[number]
+
+        start = self.offsets[number - 1]
+        if number < len(self.offsets):
+            end = self.offsets[number]
+        else:
+            end = self.size
+
+        with open(self.file, 'rb') as in_file:
+            in_file.seek(start)
+            text = in_file.read(end - start).decode('utf-8', 'replace')
+
+        text = text.rstrip('\n').rstrip('\r')
+
+        if len(self.lines) >= LineIndex.MAX_LINES:
+            self.lines.clear()
+        self.lines[number] = text
+
+        return text
+
+
+class LineCache:
+    """LRU of line indices, invalidated by file modification and size."""
+
+    def __init__(self, size=64):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = RLock()
+
+    def index(self, file):
+        stat = os.stat(file)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            index = self.entries.get(file)
+            if index and index.stamp == stamp:
+                self.entries.move_to_end(file)
+                return index
+
+        index = LineIndex(file, stamp)
+
+        with self.lock:
+            self.entries[file] = index
+            self.entries.move_to_end(file)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        return index
+
+    def invalidate(self, file):
+        with self.lock:
+            self.entries.pop(file, None)
+
+
 class Utilities:
     """Random utilities."""
 
+    lines = LineCache()
+
     @staticmethod
     def html(text):
         """Replaces control characters with HTML code."""
@@ -69,28 +166,67 @@ class Utilities:
     @staticmethod
     def file_content(file, line, column=1, length=0):
         """
+        Get a line, or part of it, from a file. Files are indexed by
+        their line offsets once, until they get modified.
         """
-        text = ""
+        index = Utilities.lines.index(file)
 
-        with open(file) as in_file:
-            file_lines = in_file.read().splitlines()
+        if line < 1 or line > index.count():
+            log.error("Line index {} exceeds line count {}".format(
+                line, index.count()))
+            return ""
 
-            if line > len(file_lines):
-                log.error("Line index {} exceeds line count {}".format(
-                    line, len(file_lines)))
-                return ""
+        file_line = index.line(line)
 
-            if column > len(file_lines[line - 1]):
-                log.error("Column index {} exceeds line size {}".format(
-                    column, len(file_lines[line - 1])))
-                return ""
+        if column > len(file_line):
+            log.error("Column index {} exceeds line size {}".format(
+                column, len(file_line)))
+            return ""
 
-            if length == 0 and column == 1:
-                length = len(file_lines[line - 1])
+        if length == 0 and column == 1:
+            length = len(file_line)
 
-            text = file_lines[line - 1][column - 1:column - 1 + length]
+        return file_line[column - 1:column - 1 + length]
 
-        return text
+    @staticmethod
+    def replace_in_lines(old, new, file_lines, target_map):
+        """
+        Replace 'old' with 'new' in the list of 'file_lines' at locations
+        identified by 'target_map' dictionary { row => [col] }. Works on
+        lines of either text or bytes. Returns the locations that did not
+        match 'old' as list of (row, col).
+        """
+        tilde = "~" if isinstance(old, str) else b"~"
+
+        mismatches = []
+
+        for row, cols in target_map.items():
+            col_skew = 0
+
+            for col in cols:
+                start = col_skew + col - 1
+
+                # We may have a leading '~' here.
+                # TODO(tillt): Is that really the only case where
+                # the reference location does not match the exact
+                # string position?
+                if file_lines[row - 1][start:start + 1] == tilde:
+                    start += 1
+                    col_skew += 1
+
+                # Safety first, only replace matching symbols.
+                if file_lines[row - 1][start:start+len(old)] == old:
+                    out_line = file_lines[row - 1][:start]
+                    out_line += new
+                    out_line += file_lines[row - 1][start + len(old):]
+
+                    col_skew += len(new) - len(old)
+
+                    file_lines[row - 1] = out_line
+                else:
+                    mismatches.append((row, col))
+
+        return mismatches
 
     @staticmethod
     def replace_in_file(old, new, file, target_map):
@@ -101,35 +237,20 @@ class Utilities:
         with open(file) as in_file:
             file_lines = in_file.read().splitlines()
 
-            for row, cols in target_map.items():
-                col_skew = 0
-
-                for col in cols:
-                    start = col_skew + col - 1
+            mismatches = Utilities.replace_in_lines(
+                old,
+                new,
+                file_lines,
+                target_map)
 
-                    # We may have a leading '~' here.
-                    # TODO(tillt): Is that really the only case where
-                    # the reference location does not match the exact
-                    # string position?
-                    if file_lines[row - 1][start:start + 1] == "~":
-                        start += 1
-                        col_skew += 1
-
-                    # Safety first, only replace matching symbols.
-                    if file_lines[row - 1][start:start+len(old)] == old:
-                        out_line = file_lines[row - 1][:start]
-                        out_line += new
-                        out_line += file_lines[row - 1][start + len(old):]
-
-                        col_skew += len(new) - len(old)
-
-                        file_lines[row - 1] = out_line
-                    else:
-                        log.error(
-                            "Symbol name does not match,"
-                            " skipping line {} column {} in file {}".format(
-                                row, col, file))
+            for (row, col) in mismatches:
+                log.error(
+                    "Symbol name does not match,"
+                    " skipping line {} column {} in file {}".format(
+                        row, col, file))
 
         with open(file, 'w') as out_file:
             for line in file_lines:
                 out_file.write("{}\n".format(line))
+
+        Utilities.lines.invalidate(file)
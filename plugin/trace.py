@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""Trace.
+
+Records trace events for the job lifecycle in the Chrome trace-event
+format, to be loaded into `chrome://tracing` or Perfetto.
+
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+
+from time import perf_counter
+
+from . import settings
+
+log = logging.getLogger("RTags")
+
+
+lock = threading.RLock()
+events = collections.deque([], maxlen=1)
+thread_names = {}
+
+
+def enabled():
+    return settings.get('trace_events', False)
+
+
+def timestamp():
+    # Trace events are timed in microseconds.
+    return perf_counter() * 1000000.0
+
+
+def add(event):
+    global events
+
+    thread = threading.current_thread()
+
+    event['pid'] = os.getpid()
+    event['tid'] = thread.ident
+
+    size = int(settings.get('trace_buffer_size', 100000))
+
+    with lock:
+        # The ring-buffer keeps memory bounded, dropping oldest events.
+        if events.maxlen != size:
+            events = collections.deque(events, maxlen=size)
+        events.append(event)
+        thread_names[thread.ident] = thread.name
+
+
+def instant(name, category, **args):
+    if not enabled():
+        return
+
+    add({
+        'name': name,
+        'cat': category,
+        'ph': 'i',
+        's': 't',
+        'ts': timestamp(),
+        'args': args})
+
+
+class Span():
+    """Records the `with` block as a complete event."""
+
+    def __init__(self, name, category, **args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        if enabled():
+            self.start = timestamp()
+        return self
+
+    def __exit__(self, *args):
+        if self.start is None:
+            return False
+
+        add({
+            'name': self.name,
+            'cat': self.category,
+            'ph': 'X',
+            'ts': self.start,
+            'dur': timestamp() - self.start,
+            'args': self.args})
+
+        return False
+
+
+def clear():
+    with lock:
+        events.clear()
+        thread_names.clear()
+
+
+def dump(file):
+    with lock:
+        trace_events = list(events)
+        names = dict(thread_names)
+
+    for tid, name in names.items():
+        trace_events.append({
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': os.getpid(),
+            'tid': tid,
+            'args': {'name': name}})
+
+    with open(file, 'w') as out_file:
+        json.dump(
+            {'traceEvents': trace_events, 'displayTimeUnit': 'ms'},
+            out_file)
+
+    log.info("Wrote {} trace events to {}".format(len(trace_events), file))
+
+    return len(trace_events)
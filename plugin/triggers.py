@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""Completion Triggers.
+
+Decides whether a matched trigger is worth a completion request, by the
+code around it and by how often its results got used before.
+
+"""
+
+import sublime
+
+import logging
+import re
+
+from threading import RLock
+
+from . import settings
+
+log = logging.getLogger("RTags")
+
+
+# Code that never completes.
+IGNORED_SCOPES = "comment, string"
+
+# Types followed by whitespace are likely followed by a name to complete.
+TYPE_SCOPES = "storage.type, support.type, entity.name.type, support.class"
+
+# Keywords followed by whitespace are likely followed by an expression.
+KEYWORDS = {"return", "new", "delete", "case", "throw"}
+
+# Opening brackets and separators followed by whitespace are likely
+# followed by an argument.
+OPENERS = "(,"
+
+# Typing on a name narrows its completions down.
+NARROWING = re.compile(r'\w*$')
+
+
+def ignored(view, point):
+    """Check if `point` is within code that never completes."""
+    return view.match_selector(point, IGNORED_SCOPES)
+
+
+def worth_completing(view, point, trigger):
+    """Check if the code before `point`, ending with `trigger`, completes.
+
+    Args:
+        view (sublime.View): current view
+        point (int): position right after the trigger
+        trigger (str): the trigger matched
+
+    Returns:
+        bool: True if a completion request is worth it
+    """
+    if ignored(view, point - len(trigger)):
+        log.debug("No completion within comments and strings")
+        return False
+
+    if not trigger.isspace():
+        return True
+
+    # Look at what comes before the whitespace.
+    before = point - len(trigger)
+    while before > 0 and view.substr(before - 1).isspace():
+        before -= 1
+
+    if before == 0:
+        return False
+
+    if view.substr(before - 1) in OPENERS:
+        return True
+
+    word = view.word(before - 1)
+    if view.substr(word) in KEYWORDS:
+        return True
+
+    if view.match_selector(word.a, TYPE_SCOPES):
+        return True
+
+    log.debug("Whitespace trigger without a context worth completing")
+
+    return False
+
+
+class Acceptance():
+    """Tracks how often the results of each trigger get accepted.
+
+    Once a trigger got its results shown for `MIN_SAMPLES` times, it gets
+    suppressed while the share of accepted ones stays below
+    `completion_trigger_min_acceptance`. Every `PROBE`th suppressed
+    request passes nevertheless, so that a trigger can recover.
+    """
+    MIN_SAMPLES = 20
+    PROBE = 10
+
+    def __init__(self):
+        self.lock = RLock()
+        self.shown = {}
+        self.accepted = {}
+        self.suppressed = {}
+        # Trigger and position of the results last shown, by view-id.
+        self.offers = {}
+
+    def allows(self, trigger):
+        minimum = float(
+            settings.get('completion_trigger_min_acceptance', 0.05))
+
+        with self.lock:
+            shown = self.shown.get(trigger, 0)
+
+            if shown < Acceptance.MIN_SAMPLES or \
+                    self.accepted.get(trigger, 0) >= minimum * shown:
+                return True
+
+            suppressed = self.suppressed.get(trigger, 0) + 1
+            self.suppressed[trigger] = suppressed
+
+        if suppressed % Acceptance.PROBE == 0:
+            log.debug("Probing suppressed trigger '{}'".format(trigger))
+            return True
+
+        log.debug("Suppressing rarely accepted trigger '{}'".format(trigger))
+
+        return False
+
+    def offered(self, view, trigger, position):
+        offer = (trigger, position)
+
+        with self.lock:
+            # Narrowing down results as typing goes on is the same offer.
+            if self.offers.get(view.id()) == offer:
+                return
+
+            self.offers[view.id()] = offer
+            self.shown[trigger] = self.shown.get(trigger, 0) + 1
+
+    def accept(self, view):
+        with self.lock:
+            offer = self.offers.pop(view.id(), None)
+
+            if not offer:
+                return
+
+            (trigger, _) = offer
+            self.accepted[trigger] = self.accepted.get(trigger, 0) + 1
+
+    def moved(self, view, point):
+        """Forget the offer of `view` once `point` left its name.
+
+        Typing on narrows the results down, anything else leaves them
+        unused.
+        """
+        with self.lock:
+            offer = self.offers.get(view.id())
+
+            if not offer:
+                return
+
+            (_, position) = offer
+
+            if position <= point and NARROWING.match(
+                    view.substr(sublime.Region(position, point))):
+                return
+
+            log.debug("Completion offer left unused")
+            del self.offers[view.id()]
+
+    def forget(self, view):
+        with self.lock:
+            self.offers.pop(view.id(), None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                trigger: {
+                    'shown': shown,
+                    'accepted': self.accepted.get(trigger, 0)
+                }
+                for trigger, shown in self.shown.items()
+            }
+
+
+acceptance = Acceptance()
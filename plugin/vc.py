@@ -9,6 +9,7 @@ import logging
 from . import status
 from . import fixits
 from . import idle
+from . import jobs
 from . import settings
 
 from functools import partial
@@ -39,6 +40,7 @@ class ViewController():
 
     def deactivated(self):
         log.debug("Deactivating view-id {}".format(self.view.id()))
+        jobs.JobController.supersede(self.view, jobs.CompletionJob.CHANNEL)
         self.idle.deactivated()
         self.fixits.deactivated()
 
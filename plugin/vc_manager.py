@@ -5,10 +5,12 @@
 """
 
 import collections
+import hashlib
 import logging
 import sublime
 
 from . import settings
+from . import snapshot
 from . import vc
 
 log = logging.getLogger("RTags")
@@ -24,6 +26,10 @@ NAVIGATION_DONE = 2
 controllers = {}
 active_controller = None
 
+# View-ids by the filename of their controller, for routing results
+# concerning a file straight to its views.
+files = {}
+
 # History of navigations.
 # Elements are tuples (filename, line, col).
 history = None
@@ -36,8 +42,10 @@ flag = NAVIGATION_DONE
 # rc utility switches to use for callback
 switches = []
 
-# File contents that has been passed to reindexer last time.
-data = ''
+# Buffer state per view-id that has been passed to the reindexer last
+# time, as tuple (change count, content digest).
+indexed = {}
+
 last_references = []
 
 
@@ -48,7 +56,7 @@ def activate_view_controller(view):
     view_id = view.id()
 
     if view_id not in controllers.keys():
-        controllers[view_id] = vc.ViewController(view)
+        attach(view)
 
     if active_controller and active_controller.view.id() == view_id:
         log.debug("Viewcontroller for view-id {} is already active"
@@ -71,11 +79,36 @@ def view_controller(view):
     view_id = view.id()
 
     if view_id not in controllers.keys():
-        controllers[view_id] = vc.ViewController(view)
+        attach(view)
 
     return controllers[view_id]
 
 
+def attach(view):
+    global controllers
+    global files
+
+    controller = vc.ViewController(view)
+    controllers[view.id()] = controller
+
+    filename = controller.fixits.filename
+    if filename:
+        if filename not in files:
+            files[filename] = set()
+        files[filename].add(view.id())
+
+    return controller
+
+
+# Get the viewcontrollers of all views showing the specified file.
+def controllers_of(filename):
+    global controllers
+    global files
+
+    return [controllers[view_id] for view_id in files.get(filename, [])
+            if view_id in controllers]
+
+
 def references():
     global last_references
 
@@ -105,20 +138,46 @@ def navigate(view, oldfile, oldline, oldcol, file, line, col):
 
 
 # Prepare a navigational transaction.
-def request_navigation(view, switches_, data_):
+def request_navigation(view, switches_):
     global switches
-    global data
     global flag
 
     switches = switches_
-    data = data_
     flag = NAVIGATION_REQUESTED
 
 
-def navigation_data():
-    global data
+def digest(data):
+    return hashlib.sha1(data).digest()
 
-    return data
+
+# Remember the buffer state that is getting passed to the reindexer.
+def set_indexed(view, data):
+    global indexed
+
+    indexed[view.id()] = (view.change_count(), digest(data))
+
+
+# Check if the reindexer has seen the current buffer state already.
+def is_indexed(view):
+    global indexed
+
+    state = indexed.get(view.id())
+    if not state:
+        return False
+
+    (version, content) = state
+
+    if version == view.change_count():
+        return True
+
+    # The buffer got changed since, still its contents might be the same
+    # again, e.g. after an undo.
+    if content != digest(snapshot.text(view)):
+        return False
+
+    indexed[view.id()] = (view.change_count(), content)
+
+    return True
 
 
 def history_size():
@@ -183,19 +242,34 @@ def unload():
 
 def close(view):
     global controllers
+    global files
 
     if not view.id() in controllers.keys():
         return
     controllers[view.id()].unload()
+
+    filename = controllers[view.id()].fixits.filename
+    if filename in files:
+        files[filename].discard(view.id())
+        if not files[filename]:
+            del files[filename]
+
     del controllers[view.id()]
+    indexed.pop(view.id(), None)
+    snapshot.forget(view)
 
 
 def close_all():
     global controllers
+    global files
+    global indexed
 
     for view_id in controllers.keys():
         controllers[view_id].unload()
     controllers = {}
+    files = {}
+    indexed = {}
+    snapshot.clear()
 
 
 def on_post_updated(view):
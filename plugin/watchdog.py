@@ -1,60 +1,216 @@
 # -*- coding: utf-8 -*-
 
 """Index Watchdog.
-Polls `rdm` to detect an indexing in progress.
+Detects the end of indexings in progress, as reported by the monitor,
+or by polling `rdm` while the monitor is down or silent. A single
+watchdog serves all views.
 """
 
 import sublime
 
 import logging
 
+from functools import partial
+from threading import RLock
+from threading import Timer
+from time import time
+
 from . import jobs
 
 log = logging.getLogger("RTags")
 
 
-class IndexWatchdog():
+class Waiter():
+    """Someone waiting for files to get indexed."""
 
-    def __init__(self):
-        self.active = False
-        self.period = 500
-        self.threshold = 10
+    def __init__(self, callback, files):
+        self.callback = callback
+        self.files = set(files)
+        self.started_at = time()
         self.indexing = False
-        self.callback = None
 
-    def stop(self):
-        if not self.active:
-            return
 
-        # Schadule into timer-thread.
-        sublime.set_timeout_async(lambda self=self: self.run(True), 0)
+class IndexWatchdog():
+    """Tells waiters when `rdm` is done indexing their files.
+
+    Monitor events end the wait of those waiting for the file in question
+    right away. Only while there is no monitor running, or it kept silent
+    for too long, `rdm` gets polled - by a single loop, whatever the
+    number of waiters.
+    """
+    # Seconds between polls, doubling with every poll once an indexing
+    # was seen in progress.
+    MIN_PERIOD = 0.5
+    MAX_PERIOD = 8.0
+    # Seconds to wait for any sign of an indexing in progress.
+    DETECTION_TIMEOUT = 5.0
+    # Seconds the monitor may keep silent before polling anyway.
+    SILENCE_TIMEOUT = 5.0
+    # Failed polls until giving up.
+    THRESHOLD = 10
+
+    def __init__(self):
+        self.lock = RLock()
+        # Waiters by their owner, e.g. a fixits controller.
+        self.waiters = {}
+        self.period = IndexWatchdog.MIN_PERIOD
+        self.threshold = IndexWatchdog.THRESHOLD
+        self.timer = None
+        # Whether the monitor is running and when it last told anything.
+        self.monitored = False
+        self.heard_at = 0
+
+    def monitoring(self, running):
+        """Tell whether the monitor is running, called by the monitor."""
+        with self.lock:
+            if self.monitored == running:
+                return
+
+            self.monitored = running
+            self.heard_at = time()
+
+            if running or not self.waiters:
+                return
+
+            # Fall back to polling right away.
+            log.debug("Watchdog polling without monitor")
+            self.period = IndexWatchdog.MIN_PERIOD
+            if self.timer:
+                self.timer.cancel()
+            self.schedule()
+
+    def silent(self):
+        with self.lock:
+            return (not self.monitored or
+                    time() - self.heard_at > IndexWatchdog.SILENCE_TIMEOUT)
+
+    def start(self, owner, callback, files):
+        with self.lock:
+            if owner in self.waiters:
+                log.debug("Watchdog already active")
+                self.waiters[owner].files.update(files)
+                return
+
+            log.debug("Watchdog starting for {}".format(files))
+            self.waiters[owner] = Waiter(callback, files)
+
+            # Newcomers want to know soon, whatever the others wait for.
+            self.period = IndexWatchdog.MIN_PERIOD
+            self.threshold = IndexWatchdog.THRESHOLD
+            if self.timer:
+                self.timer.cancel()
+            self.schedule()
+
+    def stop(self, owner):
+        if self.finish(owner, False):
+            log.debug("Stopped indexing watchdog")
+
+    def waiting(self, owner):
+        with self.lock:
+            return owner in self.waiters
+
+    def indexed(self, filename):
+        """Tell that `rdm` checked `filename`, called by the monitor."""
+        with self.lock:
+            self.heard_at = time()
+            owners = []
+            for owner, waiter in self.waiters.items():
+                if filename in waiter.files:
+                    waiter.files.discard(filename)
+                    if not waiter.files:
+                        owners.append(owner)
+
+        for owner in owners:
+            log.debug("Monitor reported {} as indexed".format(filename))
+            self.finish(owner, True)
+
+    def progress(self, index, total):
+        """Tell about the indexing progress, called by the monitor."""
+        with self.lock:
+            self.heard_at = time()
+
+        if index < total:
+            self.update(True)
+        else:
+            log.debug("Monitor reported indexing done")
+            self.update(False)
+
+    def update(self, indexing, error=None):
+        """Apply the global indexing state to all waiters."""
+        with self.lock:
+            if indexing:
+                for waiter in self.waiters.values():
+                    waiter.indexing = True
+                return
+
+            # Only an indexing seen in progress is done now, the one just
+            # finished may well have been another one.
+            detected = time() - IndexWatchdog.DETECTION_TIMEOUT
+            owners = [owner for owner, waiter in self.waiters.items()
+                      if waiter.indexing or waiter.started_at < detected]
+
+        for owner in owners:
+            self.finish(owner, True, error)
+
+    def finish(self, owner, complete, error=None):
+        with self.lock:
+            waiter = self.waiters.pop(owner, None)
+
+            if not waiter:
+                return False
+
+            if not self.waiters and self.timer:
+                self.timer.cancel()
+                self.timer = None
+
+        # Schedule into timer-thread.
+        sublime.set_timeout_async(
+            partial(waiter.callback, complete, error),
+            0)
+
+        return True
+
+    def schedule(self):
+        # Polls block on `rc`, hence they run on a thread of their own
+        # instead of Sublime's timer-thread.
+        if self.monitored:
+            # Just check back on the monitor.
+            delay = IndexWatchdog.SILENCE_TIMEOUT
+        elif any(waiter.indexing for waiter in self.waiters.values()):
+            delay = self.period
+            self.period = min(self.period * 2, IndexWatchdog.MAX_PERIOD)
+        else:
+            # Spot a starting indexing as early as possible.
+            delay = IndexWatchdog.MIN_PERIOD
+
+        self.timer = Timer(delay, self.poll)
+        self.timer.daemon = True
+        self.timer.start()
 
-    def start(self, callback):
-        if self.active:
-            log.debug("Watchdog already active")
-            return
+    def poll(self):
+        with self.lock:
+            if not self.waiters:
+                self.timer = None
+                return
+            timer = self.timer
 
-        log.debug("Watchdog starting")
-        self.active = True
-        self.threshold = 10
-        self.callback = callback
-        self.indexing = False
+        if self.silent():
+            self.query()
 
-        # Schadule into timer-thread.
-        sublime.set_timeout_async(lambda self=self: self.run(False), 0)
+        # Repeat as long as anyone is still waiting for an indexing to
+        # finish, or to recognize one in progress in the first place.
+        with self.lock:
+            if self.timer is not timer:
+                # Someone started polling afresh meanwhile.
+                return
 
-    def run(self, stopping):
-        if not self.active:
-            log.debug("Watchdog not even active - interesting case")
-            return
+            self.timer = None
 
-        if stopping:
-            log.debug("Stopping indexing watchdog now")
-            self.active = False
-            if self.callback:
-                self.callback(False)
-            return
+            if self.waiters:
+                log.debug("Retrying...")
+                self.schedule()
 
+    def query(self):
         (_, out, error) = jobs.JobController.run_sync(jobs.RTagsJob(
             "ReindexWatchdogJob",
             ["--is-indexing", "--silent-query"],
@@ -62,34 +218,16 @@ class IndexWatchdog():
 
         if error:
             log.error("Watchdog failed to poll: {}".format(error.message))
-            log.debug("Retrying...")
             self.threshold -= 1
+
+            if not self.threshold:
+                with self.lock:
+                    owners = list(self.waiters.keys())
+                for owner in owners:
+                    self.finish(owner, True, error)
         else:
-            if out.decode().strip() == "1":
-                # We are now indexing!
-                self.indexing = True
-            else:
-                # In case we did detect activity before, we now assume
-                # a done state.
-                if self.indexing is True:
-                    self.active = False
-                    if self.callback:
-                        self.callback(True)
-                    return
+            self.update(out.decode().strip() == "1")
 
-                log.debug("Retrying...")
-                self.threshold -= 1
-
-        if self.threshold == 0:
-            log.debug("We never even recognized an indexing in progress")
-            self.active = False
-            if self.callback:
-                self.callback(True, error)
-            return
-
-        # Repeat as long as we are still indexing OR we are still trying
-        # to recognize the first indication of an ongoing indexing before
-        # the theshold expires.
-        sublime.set_timeout_async(
-            lambda self=self: self.run(False),
-            self.period)
+
+# The one and only watchdog.
+service = IndexWatchdog()
@@ -14,15 +14,25 @@ import sublime_plugin
 
 import json
 import logging
+import os
 import re
+import tempfile
 
 from functools import partial
 
 from .plugin import completion
+from .plugin import diagnostics
 from .plugin import info
 from .plugin import jobs
+from .plugin import metrics
+from .plugin import monitor
+from .plugin import reindex
+from .plugin import rename
 from .plugin import settings
+from .plugin import snapshot
 from .plugin import tools
+from .plugin import trace
+from .plugin import triggers
 from .plugin import vc_manager
 
 
@@ -44,7 +54,7 @@ if not log.hasHandlers():
 
 
 def get_view_text(view):
-    return bytes(view.substr(sublime.Region(0, view.size())), "utf-8")
+    return snapshot.text(view)
 
 
 def get_word_under_cursor(view):
@@ -112,11 +122,37 @@ def supported_view(view):
     return True
 
 
+class Stream():
+    """State of a single command run while its results stream in.
+
+    Sublime shares a command instance between all runs within a view, so
+    this is kept apart from it.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.streamed = 0
+        # Rename mutations, as { file => { row => [col] } }.
+        self.mutations = {}
+        self.occurrences = 0
+
+
 class RtagsBaseCommand(sublime_plugin.TextCommand):
     FILE_INFO_REG = r'(.*):(\d+):(\d+):(.*)'
     MAX_POPUP_WIDTH = 1800
     MAX_POPUP_HEIGHT = 900
 
+    # Jobs get named after what they query, their metrics are told apart
+    # by that name. The first switch found names the job.
+    JOB_NAMES = [
+        ('--rename', "RTRenameJob"),
+        ('--symbol-info', "RTSymbolInfoJob"),
+        ('-f', "RTFollowSymbolJob"),
+        ('-k', "RTFindVirtualsJob"),
+        ('-r', "RTReferencesJob"),
+        ('--find-dead-functions', "RTDeadFunctionsJob")
+    ]
+
     def command_done(self, future, **kwargs):
         log.debug("Command done callback hit {}".format(future))
 
@@ -156,7 +192,8 @@ class RtagsBaseCommand(sublime_plugin.TextCommand):
 
         vc_manager.navigation_done()
 
-        self._action(out, **kwargs)
+        with metrics.Timer(metrics.category(job_id), 'render'):
+            self._action(out, **kwargs)
 
     def run(self, edit, switches, *args, **kwargs):
         # Do nothing if not called from supported code.
@@ -165,33 +202,79 @@ class RtagsBaseCommand(sublime_plugin.TextCommand):
         # File should be reindexed only when
         # 1. file buffer is dirty (modified)
         # 2. there is no pending reindexation (navigation_helper flag)
-        # 3. current text is different from previous one
-        # It takes ~40-50 ms to reindex 2.5K C file and
-        # miserable amount of time to check text difference.
+        # 3. current text is different from the one indexed last
+        # It takes ~40-50 ms to reindex 2.5K C file while an unchanged
+        # buffer is told by its change count alone.
         if (vc_manager.is_navigation_done() and
             self.view.is_dirty() and
-                vc_manager.navigation_data() != get_view_text(self.view)):
+                not vc_manager.is_indexed(self.view)):
 
-            vc_manager.request_navigation(
-                self.view, switches,
-                get_view_text(self.view))
+            vc_manager.request_navigation(self.view, switches)
+            vc_manager.set_indexed(self.view, get_view_text(self.view))
             vc_manager.view_controller(self.view).fixits.reindex(saved=False)
             # Never go further.
             return
 
-        # Run an `RTagsJob` named 'RTBaseCommandXXXX' for this is a
-        # command job.
+        # Run a `StreamingJob` named after its query, like
+        # 'RTReferencesJobXXXX'.
         job_args = kwargs
         job_args.update({'view': self.view})
 
+        cache_scope = self._cache_scope()
+        if cache_scope:
+            job_args.update({
+                'cache_file': self.view.file_name(),
+                'cache_version': self.view.change_count(),
+                'cache_scope': cache_scope})
+
+        if not self._coalesce():
+            job_args.update({'coalesce': False})
+
+        stream = Stream(self._limit(switches))
+
         jobs.JobController.run_async(
-            jobs.RTagsJob(
-                "RTBaseCommand" + jobs.JobController.next_id(),
+            jobs.StreamingJob(
+                self._job_name(switches) + jobs.JobController.next_id(),
                 switches + [self._query(*args, **kwargs)],
+                partial(self._consume, stream),
                 **job_args),
-            partial(self.command_done, **kwargs),
+            partial(self.command_done, stream=stream, **kwargs),
             vc_manager.view_controller(self.view).status.progress)
 
+    def _job_name(self, switches):
+        for (switch, name) in RtagsBaseCommand.JOB_NAMES:
+            if switch in switches:
+                return name
+        return "RTBaseCommand"
+
+    def _cache_scope(self):
+        return jobs.ResultCache.PROJECT
+
+    def _coalesce(self):
+        return True
+
+    def _limit(self, switches):
+        # Following a symbol gives us a single location, there is no need
+        # to wait for anything beyond that.
+        if '-f' in switches:
+            return 1
+        return int(settings.get('navigation_result_limit', 0))
+
+    def _consume(self, stream, lines):
+        # Called on the worker thread while results keep coming in.
+        stream.streamed += len(lines)
+
+        if stream.limit and stream.streamed >= stream.limit:
+            return False
+
+        count = stream.streamed
+        sublime.set_timeout(
+            lambda: sublime.status_message(
+                "RTags found {} results so far...".format(count)),
+            0)
+
+        return True
+
     def on_select(self, res):
         if res == -1:
             vc_manager.return_in_history(self.view)
@@ -221,9 +304,11 @@ class RtagsBaseCommand(sublime_plugin.TextCommand):
     def _query(self, *args, **kwargs):
         return ''
 
-    def _action(self, out, **kwargs):
+    def _action(self, out, stream=None, **kwargs):
         # Get current cursor location.
         # Called by the completion handler of the RTags command execution.
+        limit = stream.limit if stream else 0
+
         cursorLine, cursorCol = self.view.rowcol(self.view.sel()[0].a)
         vc_manager.push_history(
             self.view.file_name(),
@@ -234,6 +319,13 @@ class RtagsBaseCommand(sublime_plugin.TextCommand):
         items = list(map(lambda x: x.decode('utf-8'), out.splitlines()))
         log.debug("Got items from command: {}".format(items))
 
+        if limit and len(items) > limit:
+            items = items[:limit]
+
+        if limit > 1 and len(items) == limit:
+            sublime.status_message(
+                "RTags shows the first {} results only".format(limit))
+
         def out_to_tuple(item):
             (file, line, col, usage) = re.findall(
                 RtagsBaseCommand.FILE_INFO_REG,
@@ -498,6 +590,75 @@ class RtagsShowFixitsCommand(sublime_plugin.TextCommand):
             on_select)
 
 
+class RtagsShowProjectErrorsCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit, types=None):
+        if not types:
+            types = ['error']
+
+        tuples = []
+
+        for (file, issues) in diagnostics.store.items():
+            for category in types:
+                for issue in issues.get(category, []):
+                    tuples.append([
+                        category,
+                        issue['message'],
+                        file,
+                        issue['line'],
+                        issue['column']])
+
+        if not tuples:
+            sublime.status_message("RTags knows of no {} in this project"
+                                   .format(" or ".join(types)))
+            return
+
+        # Sort the tuples by file and then line number and column.
+        tuples.sort(key=lambda item: (item[2], item[3], item[4]))
+
+        def tuple_to_panel_item(item):
+            return [
+                "{}: {}".format(item[0], item[1]),
+                "{}:{}:{}".format(item[2], item[3], item[4])]
+
+        panel_items = list(map(tuple_to_panel_item, tuples))
+
+        def open_item(index, flags):
+            self.view.window().open_file(
+                '%s:%s:%s' % (
+                    tuples[index][2],
+                    tuples[index][3],
+                    tuples[index][4]),
+                flags)
+
+        def on_select(index):
+            if index == -1:
+                return
+
+            if supported_view(self.view):
+                cursorLine, cursorCol = self.view.rowcol(
+                    self.view.sel()[0].a)
+                vc_manager.push_history(
+                    self.view.file_name(),
+                    int(cursorLine) + 1,
+                    int(cursorCol) + 1)
+
+            open_item(index, sublime.ENCODED_POSITION)
+
+        def on_highlight(index):
+            if index == -1:
+                return
+
+            open_item(index, sublime.ENCODED_POSITION | sublime.TRANSIENT)
+
+        self.view.window().show_quick_panel(
+            panel_items,
+            on_select,
+            sublime.MONOSPACE_FONT,
+            -1,
+            on_highlight)
+
+
 class RtagsFixitCommand(RtagsBaseCommand):
 
     def run(self, edit, **args):
@@ -514,23 +675,47 @@ class RtagsGoBackwardCommand(sublime_plugin.TextCommand):
 
 class RtagsSymbolRenameCommand(RtagsLocationCommand):
 
-    def _action(self, out, **kwargs):
-        # Called by the completion handler of the RTags command execution.
+    def _cache_scope(self):
+        # Mutations get grouped while streaming, a cached result would
+        # skip that.
+        return None
 
-        items = list(map(lambda x: x.decode('utf-8'), out.splitlines()))
+    def _coalesce(self):
+        # Same as above, sharing another job's stream would skip that.
+        return False
+
+    def _limit(self, switches):
+        # Renaming needs each and every occurrence.
+        return 0
 
-        def out_to_items(item):
-            (file, row, col, _) = re.findall(
+    def _consume(self, stream, lines):
+        # Group all source file and line mutations as they come in.
+        for line in lines:
+            (file, row_, col_, _) = re.findall(
                 RtagsBaseCommand.FILE_INFO_REG,
-                item)[0]
-            return [file, int(row), int(col)]
+                line.decode('utf-8'))[0]
 
-        items = list(map(out_to_items, items))
+            row = int(row_)
+            col = int(col_)
 
-        if len(items) == 0:
-            return
+            log.debug("file {}, row {}, col {}".format(file, row, col))
 
-        self.old_name = ""
+            if file not in stream.mutations:
+                stream.mutations[file] = {}
+            if row not in stream.mutations[file]:
+                stream.mutations[file][row] = []
+
+            stream.mutations[file][row].append(col)
+
+            stream.occurrences += 1
+
+        return RtagsLocationCommand._consume(self, stream, lines)
+
+    def _action(self, out, stream=None, **kwargs):
+        # Called by the completion handler of the RTags command execution.
+        # All occurrences have already been grouped while streaming.
+        if not stream or stream.occurrences == 0:
+            return
 
         word = get_word_under_cursor(self.view)
         if not word:
@@ -538,50 +723,40 @@ class RtagsSymbolRenameCommand(RtagsLocationCommand):
         if not len(word):
             return
 
-        self.old_name = word
-        self.mutations = {}
-
-        for (file, row, col) in items:
-            log.debug("file {}, row {}, col {}".format(file, row, col))
-
-            # Group all source file and line mutations.
-            if file not in self.mutations:
-                self.mutations[file] = {}
-            if row not in self.mutations[file]:
-                self.mutations[file][row] = []
-
-            self.mutations[file][row].append(col)
-
         self.view.window().show_input_panel(
             "Rename {} occurance/s in {} file/s to".format(
-                len(items),
-                len(self.mutations)),
-            self.old_name,
-            self.on_done,
+                stream.occurrences,
+                len(stream.mutations)),
+            word,
+            partial(self.on_done, word, stream.mutations),
             None,
             None)
 
-    def on_done(self, new_name):
-        active_view = self.view
+    def on_done(self, old_name, mutations, new_name):
+        if new_name == old_name:
+            return
 
-        for file in self.mutations:
-            # Make sure we got the file opened, for undo context.
-            self.view.window().open_file(file)
+        rename.Rename(old_name, new_name, mutations).run()
 
-            tools.Utilities.replace_in_file(
-                self.old_name,
-                new_name,
-                file,
-                self.mutations[file])
 
-            vc_manager.on_post_updated(self.view)
+class RtagsReplaceRegionsCommand(sublime_plugin.TextCommand):
 
-        # Switch focus back to the orignal active view to reduce confusion.
-        self.view.window().focus_view(active_view)
+    def run(self, edit, regions, text):
+        # Back to front, so that earlier regions stay where they are.
+        for (a, b) in sorted(regions, reverse=True):
+            self.view.replace(edit, sublime.Region(a, b), text)
 
 
 class RtagsSymbolInfoCommand(RtagsLocationCommand):
 
+    def _cache_scope(self):
+        return jobs.ResultCache.FILE
+
+    def _limit(self, switches):
+        # Symbol information is a JSON document, cutting it short would
+        # render it useless.
+        return 0
+
     def _action(self, out, **kwargs):
         # Hover will give us coordinates here, keyboard-called symbol-
         # info will not give us coordinates, so we need to get em now.
@@ -592,38 +767,87 @@ class RtagsSymbolInfoCommand(RtagsLocationCommand):
         else:
             row, col = self.view.rowcol(self.view.sel()[0].a)
 
-        info.Controller.action(self.view, row, col, out)
+        info.Controller.action(
+            self.view,
+            row,
+            col,
+            out,
+            kwargs.get('channel'))
 
 
-class RtagsHoverInfo(sublime_plugin.EventListener):
+class RtagsShowMetricsCommand(sublime_plugin.TextCommand):
 
-    def on_hover(self, view, point, hover_zone):
-        if hover_zone != sublime.HOVER_TEXT:
+    def run(self, edit, format="text", file=None):
+        if format == "json":
+            report = metrics.as_json({
+                'lanes': jobs.JobController.lane_stats(),
+                'cache': jobs.JobController.cache.stats()})
+        else:
+            lanes = jobs.JobController.lane_stats()
+
+            def lane_to_line(lane):
+                return "{:<12} {:>3}/{:<3} queued {:>4}, " \
+                       "waited {:.2f}/{:.2f} ms mean/max".format(
+                            lane['lane'],
+                            lane['running'],
+                            lane['capacity'],
+                            lane['queued'],
+                            lane['wait_mean'] * 1000.0,
+                            lane['wait_max'] * 1000.0)
+
+            cache = jobs.JobController.cache.stats()
+
+            report = "{}\n\n{}\n\ncache {} entries, {} hits, {} misses\n" \
+                .format(
+                    metrics.as_text(),
+                    "\n".join(map(lane_to_line, lanes)),
+                    cache['entries'],
+                    cache['hits'],
+                    cache['misses'])
+
+        if file:
+            with open(file, 'w') as out_file:
+                out_file.write(report)
+            log.info("Wrote metrics to {}".format(file))
             return
 
-        if not supported_view(view):
-            log.debug("Unsupported view")
-            return
+        view = self.view.window().new_file()
+        view.set_name("RTags Metrics")
+        view.set_scratch(True)
+        view.run_command('append', {'characters': report})
 
-        if not settings.get("hover"):
-            return
 
-        # Make sure the underlying view is in focus - enables in turn
-        # that the view-controller shows its status.
-        view.window().focus_view(view)
+class RtagsDumpTraceCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit, file=None):
+        if not file:
+            file = os.path.join(
+                tempfile.gettempdir(),
+                "rtags-trace-{}.json".format(os.getpid()))
+
+        count = trace.dump(file)
+
+        sublime.status_message(
+            "RTags wrote {} trace events to {}".format(count, file))
+
+
+class RtagsHoverInfo(sublime_plugin.EventListener):
+
+    def on_hover(self, view, point, hover_zone):
+        with trace.Span('on_hover', 'ui', view=view.id()):
+            if not settings.get("hover"):
+                return
+
+            if not supported_view(view):
+                log.debug("Unsupported view")
+                return
+
+            # Hovering anything else still ends a pending symbol hover.
+            if hover_zone != sublime.HOVER_TEXT:
+                info.Hover.cancel(view)
+                return
 
-        (row, col) = view.rowcol(point)
-        view.run_command(
-            'rtags_symbol_info',
-            {
-                'switches': [
-                    '--absolute-path',
-                    '--json',
-                    '--symbol-info'
-                ],
-                'col': col,
-                'row': row
-            })
+            info.Hover.request(view, point)
 
 
 class RtagsNavigationListener(sublime_plugin.EventListener):
@@ -639,12 +863,27 @@ class RtagsNavigationListener(sublime_plugin.EventListener):
         return view.rowcol(pos)
 
     def on_activated(self, view):
+        with trace.Span('on_activated', 'ui', view=view.id()):
+            if not supported_view(view):
+                log.debug("Unsupported view")
+                return
+
+            log.debug("Activated supported view for view-id {}".format(
+                view.id()))
+            vc_manager.activate_view_controller(view)
+
+            if settings.get('validation'):
+                monitor.Monitor.start()
+
+            if settings.get('auto_complete', True) and \
+                    settings.get('completion_warm_up', False):
+                completion.warm_up(view)
+
+    def on_deactivated(self, view):
         if not supported_view(view):
-            log.debug("Unsupported view")
             return
 
-        log.debug("Activated supported view for view-id {}".format(view.id()))
-        vc_manager.activate_view_controller(view)
+        completion.cancel_warm_up(view)
 
     def on_close(self, view):
         if not supported_view(view):
@@ -653,23 +892,34 @@ class RtagsNavigationListener(sublime_plugin.EventListener):
 
         log.debug("Closing view for view-id {}".format(view.id()))
         vc_manager.close(view)
+        completion.cache.forget(view)
+        triggers.acceptance.forget(view)
 
     def on_modified(self, view):
-        if not supported_view(view):
-            log.debug("Unsupported view")
-            return
+        with trace.Span('on_modified', 'ui', view=view.id()):
+            if not supported_view(view):
+                log.debug("Unsupported view")
+                return
 
-        vc_manager.view_controller(view).fixits.clear()
-        vc_manager.view_controller(view).idle.trigger()
+            completion.cancel_warm_up(view)
+            triggers.acceptance.moved(view, view.sel()[0].b)
+            vc_manager.view_controller(view).fixits.clear()
+            vc_manager.view_controller(view).idle.trigger()
 
     def on_post_save(self, view):
-        log.debug("Post save triggered")
-        # Do nothing if not called from supported code.
-        if not supported_view(view):
-            log.debug("Unsupported view")
-            return
+        with trace.Span('on_post_save', 'ui', view=view.id()):
+            log.debug("Post save triggered")
+            # Do nothing if not called from supported code.
+            if not supported_view(view):
+                log.debug("Unsupported view")
+                return
+
+            vc_manager.on_post_updated(view)
 
-        vc_manager.on_post_updated(view)
+    def on_text_command(self, view, command_name, args):
+        # Accepted before inserting the completion modifies the view.
+        if command_name == 'commit_completion' and supported_view(view):
+            triggers.acceptance.accept(view)
 
     def on_post_text_command(self, view, command_name, args):
         # Do nothing if not called from supported code.
@@ -680,19 +930,39 @@ class RtagsNavigationListener(sublime_plugin.EventListener):
         if command_name == 'undo' and not view.is_dirty():
             vc_manager.on_post_updated(view)
 
+        if command_name == 'hide_auto_complete':
+            triggers.acceptance.forget(view)
+
+
+# Only Sublime Text 4 tells where text changed. Without it, completion keys
+# are only reused for an unchanged view.
+if hasattr(sublime_plugin, 'TextChangeListener'):
+
+    class RtagsTextChangeListener(sublime_plugin.TextChangeListener):
+
+        def on_text_changed(self, changes):
+            if not changes:
+                return
+
+            begin = min(change.a.pt for change in changes)
+
+            for view in self.buffer.views():
+                completion.cache.modified(view, begin)
+
 
 class RtagsCompleteListener(sublime_plugin.EventListener):
 
     def on_query_completions(self, view, prefix, locations):
-        # Check if autocompletion was disabled for this plugin.
-        if not settings.get('auto_complete', True):
-            return []
+        with trace.Span('on_query_completions', 'ui', view=view.id()):
+            # Check if autocompletion was disabled for this plugin.
+            if not settings.get('auto_complete', True):
+                return []
 
-        # Do nothing if not called from supported code.
-        if not supported_view(view):
-            return []
+            # Do nothing if not called from supported code.
+            if not supported_view(view):
+                return []
 
-        return completion.query(view, prefix, locations)
+            return completion.query(view, prefix, locations)
 
 
 def update_settings():
@@ -740,4 +1010,6 @@ def plugin_loaded():
 
 
 def plugin_unloaded():
+    monitor.Monitor.stop()
+    reindex.Scheduler.clear()
     jobs.JobController.stop_all()
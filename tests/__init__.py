@@ -3,8 +3,19 @@ __all__ = (
     "test_tools",
     "test_settings",
     "test_jobs",
+    "test_engine",
+    "test_metrics",
+    "test_jsonstream",
+    "test_diagnostics",
+    "test_rename",
+    "test_reindex",
+    "test_watchdog",
+    "test_triggers",
+    "test_snapshot",
     "test_idle",
     "test_completion",
     "test_vc",
     "test_progress",
-    "test_fixits")
+    "test_fixits",
+    "test_info",
+    "test_trace")
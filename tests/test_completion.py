@@ -1,10 +1,12 @@
 """Tests for Completion Controller."""
 from concurrent import futures
 from os import path
+from unittest import TestCase
 from unittest import mock
 
 from RTagsComplete.plugin import completion
 from RTagsComplete.plugin import jobs
+from RTagsComplete.plugin import metrics
 from RTagsComplete.tests.gui_wrapper import GuiTestWrapper
 
 
@@ -26,28 +28,28 @@ class TestCompletionController(GuiTestWrapper):
         jobs.JobController.stop_all()
         super().tearDown()
 
+    @mock.patch.object(jobs.JobController, 'next_id', return_value="42")
     @mock.patch("subprocess.Popen")
-    def test_completion_at(self, mock_popen):
+    def test_completion_at(self, mock_popen, mock_next_id):
         """ Test completion logic using a mocked RTags request. """
         prefix = ""
         locations = [182]
 
-        trigger_position = locations[0] - len(prefix)
-        job_id = "RTCompletionJob{}".format(trigger_position)
+        job_id = "RTCompletionJob42"
 
         # Mock subprocess.
         mock_process = mock.Mock()
 
-        # `communicate` returns a set of bytestreams.
-        mock_process.communicate = mock.Mock(return_value=(
-            b' bar void bar() CXXMethod  A \n'
-            b' foo void foo(double a) CXXMethod  A \n'
-            b' multi void multi(double a, int b, A *c) CXXMethod  A \n'
-            b' A A:: ClassDecl  A \n'
-            b' operator= A & operator=(const A &) CXXMethod  A \n'
-            b' operator= A & operator=(A &&) CXXMethod  A \n'
+        # `stdout` streams the results line by line.
+        mock_process.stdout.readline = mock.Mock(side_effect=[
+            b' bar void bar() CXXMethod  A \n',
+            b' foo void foo(double a) CXXMethod  A \n',
+            b' multi void multi(double a, int b, A *c) CXXMethod  A \n',
+            b' A A:: ClassDecl  A \n',
+            b' operator= A & operator=(const A &) CXXMethod  A \n',
+            b' operator= A & operator=(A &&) CXXMethod  A \n',
             b' ~A void ~A() CXXDestructor  A \n',
-            b''))
+            b''])
 
         # `__enter__` returns the mock subprocess.
         mock_process.__enter__ = mock.Mock(return_value=mock_process)
@@ -86,8 +88,304 @@ class TestCompletionController(GuiTestWrapper):
             ('void ~A() CXXDestructor\tA', '~A()$0')]
 
         self.assertEqual(tested_job_id, job_id)
-        self.assertEqual(tested_out, expect_out)
+        self.assertEqual(
+            [completion.render() for completion in tested_out],
+            expect_out)
 
         # We should now see a completions list on the screen.
         # TODO(tillt): Find a way to locate and maybe even validate
         # the completion popup content.
+
+
+class TestCompletionResults(TestCase):
+    """Test reading, narrowing down and caching completions."""
+
+    LINES = [
+        b' bar void bar() CXXMethod  A ',
+        b' Baz int Baz VarDecl  A ',
+        b' abort void abort() CXXMethod  A ',
+        b' foo void foo(double a) CXXMethod  A ']
+
+    def parse(self):
+        return [jobs.Completion.parse(line) for line in self.LINES]
+
+    def names(self, completions):
+        return [completion.name for completion in completions]
+
+    def test_read(self):
+        """Test that reading stops at the limit, without rendering."""
+        job = jobs.CompletionJob(
+            "RTCompletionJob0", "a.cpp", b'', 0, 0, 0, None, 2)
+
+        self.assertEqual(job.command_info[-2:], ['--max', '2'])
+
+        metrics.reset()
+
+        self.assertTrue(job.feed(self.LINES[0] + b'\n'))
+        self.assertFalse(job.feed(self.LINES[1] + b'\n'))
+        self.assertEqual(job.finish(-9), (b'', None))
+
+        self.assertEqual(
+            metrics.report()["CompletionJob"]["parse"]["count"], 1)
+
+        (_, completions, error, _) = job.results(b'', None)
+
+        self.assertIsNone(error)
+        self.assertEqual(self.names(completions), ["bar", "Baz"])
+        self.assertIsNone(completions[0].rendered)
+        self.assertEqual(
+            completions[0].render(),
+            ('void bar() CXXMethod\tA', 'bar()$0'))
+
+    def test_filter(self):
+        """Test that matching prefixes rank before scattered matches."""
+        completions = self.parse()
+
+        self.assertEqual(
+            completion.filter_completions(completions, ""),
+            completions)
+
+        self.assertEqual(
+            self.names(completion.filter_completions(completions, "ba")),
+            ["bar", "Baz"])
+
+        self.assertEqual(
+            self.names(completion.filter_completions(completions, "Br")),
+            ["bar", "abort"])
+
+        self.assertEqual(
+            completion.suggestions(completions, "fo"),
+            [('void foo(double a) CXXMethod\tA', 'foo($0${1:double a})')])
+
+    def test_fallback(self):
+        """Test falling back to comparable results, then to symbols."""
+        completions = self.parse()
+
+        view = mock.Mock()
+        view.file_name.return_value = "a.cpp"
+
+        with mock.patch.object(completion, 'cache', completion.Cache()), \
+                mock.patch.object(
+                    completion, 'symbols', completion.Symbols()):
+            self.assertIsNone(
+                completion.fallback(view, ("a.cpp", 5, b'0'), "a.", ""))
+
+            completion.symbols.add("a.cpp", completions[:2])
+            completion.symbols.add("a.cpp", completions[1:])
+            self.assertEqual(
+                completion.fallback(view, ("a.cpp", 5, b'0'), "a.", "ab"),
+                [('void abort() CXXMethod\tA', 'abort()$0')])
+
+            completion.cache.put(("a.cpp", 5, b'1'), completions[3:], "b.")
+            completion.cache.put(("b.cpp", 9, b'2'), completions[2:], "a.")
+            completion.cache.put(("a.cpp", 9, b'3'), completions[:1], "a.")
+
+            (result, _) = completion.fallback(
+                view, ("a.cpp", 5, b'0'), "a.", "")
+            self.assertEqual(result, [completions[3].render()])
+
+            (result, _) = completion.fallback(
+                view, ("a.cpp", 7, b'0'), "a.", "")
+            self.assertEqual(result, [completions[0].render()])
+
+    def test_key(self):
+        """Test that keys get hashed anew only once typing left them."""
+        view = mock.Mock()
+        view.id.return_value = 1
+        view.file_name.return_value = "a.cpp"
+        view.change_count.return_value = 1
+        view.substr.return_value = "a."
+
+        cache = completion.Cache()
+
+        key = cache.key(view, 2)
+        self.assertEqual(key, cache.key(view, 2))
+
+        # Typing on behind the trigger.
+        view.change_count.return_value = 2
+        cache.modified(view, 2)
+        self.assertEqual(key, cache.key(view, 2))
+        self.assertEqual(view.substr.call_count, 1)
+
+        # Changing text before the trigger, wherever the carets are.
+        view.change_count.return_value = 3
+        cache.modified(view, 1)
+        view.substr.return_value = "b."
+        self.assertNotEqual(key, cache.key(view, 2))
+
+        # Modified without telling where.
+        view.change_count.return_value = 4
+        view.substr.return_value = "a."
+        self.assertEqual(key, cache.key(view, 2))
+        self.assertEqual(view.substr.call_count, 3)
+
+    def test_eviction(self):
+        """Test that least recently used results get evicted first."""
+        with mock.patch(
+                'RTagsComplete.plugin.settings.get',
+                return_value=2):
+            cache = completion.Cache()
+
+            cache.put("a", [1])
+            cache.put("b", [2])
+            cache.get("a")
+            cache.put("c", [3])
+
+            self.assertEqual(cache.get("a"), [1])
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(cache.get("c"), [3])
+
+
+class TestCompletionDelivery(TestCase):
+    """Test showing results once they arrive."""
+
+    def setUp(self):
+        completion.reset()
+
+        self.view = mock.Mock()
+        self.view.id.return_value = 1
+        self.view.sel.return_value = [mock.Mock(a=10)]
+        self.view.word.return_value = mock.Mock(a=7)
+
+        window = mock.Mock()
+        window.active_view.return_value = self.view
+
+        patch = mock.patch('sublime.active_window', create=True,
+                           return_value=window)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_deliver(self):
+        """Test that arriving results get shown once at most."""
+        completion.expect(self.view, "a")
+        completion.deliver(self.view, "a", 10, "1")
+        completion.deliver(self.view, "a", 10, "1")
+        self.assertEqual(self.view.run_command.call_count, 2)
+
+        # Results found cached meanwhile got shown by the query.
+        completion.expect(self.view, "b")
+        self.assertTrue(completion.take(self.view, "b"))
+        completion.deliver(self.view, "b", 10, "2")
+        self.assertEqual(self.view.run_command.call_count, 2)
+
+        # Results of a position left behind are not shown.
+        completion.expect(self.view, "c")
+        completion.expect(self.view, "d")
+        completion.deliver(self.view, "c", 10, "3")
+        self.assertEqual(self.view.run_command.call_count, 2)
+
+    def test_requests(self):
+        """Test that repeated requests at one position all get to run."""
+        submitted = []
+
+        self.view.file_name.return_value = "a.cpp"
+        self.view.size.return_value = 10
+        self.view.rowcol.return_value = (0, 10)
+
+        patches = [
+            mock.patch.object(
+                completion,
+                'position_status',
+                return_value=completion.PositionStatus.COMPLETION_NEEDED),
+            mock.patch.object(
+                completion, 'match_trigger', return_value=(".", False)),
+            mock.patch.object(
+                completion.Cache, 'context', return_value="a."),
+            mock.patch(
+                'RTagsComplete.plugin.snapshot.text', return_value=b''),
+            mock.patch('RTagsComplete.plugin.vc_manager.view_controller'),
+            mock.patch.object(
+                jobs.JobController,
+                'run_async',
+                side_effect=lambda job, *args: submitted.append(job)),
+            mock.patch(
+                'RTagsComplete.plugin.settings.get',
+                side_effect=lambda key, default=None: default)
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        for change_count in [1, 2]:
+            self.view.change_count.return_value = change_count
+            self.view.substr.return_value = "a{}.".format(change_count)
+            completion.query(self.view, "", [10])
+
+        self.assertEqual(len(submitted), 2)
+        self.assertNotEqual(submitted[0].job_id, submitted[1].job_id)
+
+    def test_moved(self):
+        """Test that results only show at their trigger position."""
+        completion.expect(self.view, "a")
+        completion.deliver(self.view, "a", 7, "1")
+        self.assertEqual(self.view.run_command.call_count, 2)
+
+        completion.expect(self.view, "b")
+        completion.deliver(self.view, "b", 3, "2")
+        self.assertEqual(self.view.run_command.call_count, 2)
+
+    def test_inactive(self):
+        """Test that results only show within the active view."""
+        other = mock.Mock()
+        other.id.return_value = 2
+
+        completion.expect(other, "a")
+        completion.deliver(other, "a", 10, "1")
+        self.assertEqual(other.run_command.call_count, 0)
+
+
+class TestCompletionWarmUp(TestCase):
+    """Test warming up completion on activation."""
+
+    def setUp(self):
+        completion.reset()
+
+        self.view = mock.Mock()
+        self.view.id.return_value = 1
+        self.view.file_name.return_value = "a.cpp"
+        self.view.size.return_value = 0
+
+        self.futures = []
+
+        def run_async(job, callback=None, indicator=None):
+            self.assertEqual(job.lane, 'background')
+            self.assertEqual(job.category(), "CompletionWarmUpJob")
+            future = futures.Future()
+            self.futures.append(future)
+            return future
+
+        patches = [
+            mock.patch.object(jobs.JobController, 'run_async', run_async),
+            mock.patch.object(jobs.JobController, 'cancel'),
+            mock.patch(
+                'RTagsComplete.plugin.snapshot.text',
+                return_value=b'')
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_warm_up(self):
+        """Test that files get warmed up once, unless cancelled."""
+        completion.warm_up(self.view)
+        completion.warm_up(self.view)
+        self.assertEqual(len(self.futures), 1)
+
+        self.futures[0].set_result(("1", [], None, self.view))
+        completion.warm_up(self.view)
+        self.assertEqual(len(self.futures), 1)
+
+        completion.reset()
+        completion.warm_up(self.view)
+        completion.cancel_warm_up(self.view)
+        self.assertEqual(jobs.JobController.cancel.call_count, 1)
+
+        completion.warm_up(self.view)
+        self.assertEqual(len(self.futures), 3)
+
+        # Superseded elsewhere, e.g. when the view got deactivated.
+        self.futures[2].cancel()
+        completion.warm_up(self.view)
+        self.assertEqual(len(self.futures), 4)
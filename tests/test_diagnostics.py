@@ -0,0 +1,59 @@
+"""Tests for the project-wide diagnostics store."""
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import diagnostics
+
+
+def issues(errors, warnings=0):
+    def issue(line):
+        return {'line': line, 'column': 1, 'message': "message"}
+
+    return {
+        'error': [issue(line) for line in range(errors)],
+        'warning': [issue(line) for line in range(warnings)],
+        'note': []
+    }
+
+
+class TestDiagnosticsStore(TestCase):
+    """Test storing and evicting diagnostics."""
+
+    def test_put_get(self):
+        """Test that files get replaced and clean files dropped."""
+        store = diagnostics.Store()
+
+        store.put("a.cpp", issues(2, 1))
+        self.assertEqual(store.stats(), {'files': 1, 'issues': 3})
+
+        store.put("a.cpp", issues(1))
+        self.assertEqual(len(store.get("a.cpp")['error']), 1)
+        self.assertEqual(store.stats(), {'files': 1, 'issues': 1})
+
+        store.put("a.cpp", issues(0))
+        self.assertIsNone(store.get("a.cpp"))
+        self.assertEqual(store.stats(), {'files': 0, 'issues': 0})
+
+    def test_eviction(self):
+        """Test that least recently used files get evicted first."""
+        limits = {'diagnostics_max_files': 2, 'diagnostics_max_issues': 5}
+
+        with mock.patch(
+                'RTagsComplete.plugin.settings.get',
+                side_effect=lambda key, default=None: limits[key]):
+            store = diagnostics.Store()
+
+            store.put("a.cpp", issues(1))
+            store.put("b.cpp", issues(1))
+            store.get("a.cpp")
+            store.put("c.cpp", issues(1))
+
+            self.assertIsNotNone(store.get("a.cpp"))
+            self.assertIsNone(store.get("b.cpp"))
+
+            # Too many issues in total evict c.cpp, a.cpp got used since.
+            store.put("d.cpp", issues(4))
+
+            self.assertEqual(
+                [file for (file, _) in store.items()],
+                ["a.cpp", "d.cpp"])
@@ -0,0 +1,50 @@
+"""Tests for the asyncio job engine."""
+import sys
+
+from unittest import TestCase
+from unittest import mock
+from unittest import skipIf
+
+from RTagsComplete.plugin import jobs
+from RTagsComplete.plugin import settings
+
+
+class TestMonitorJob(jobs.MonitorJob):
+
+    def prepare_command(self):
+        return [
+            '/bin/sh',
+            '-c',
+            'sleep 1 && echo \'{"checkStyle": {"a.cpp": []}}\'']
+
+
+@skipIf(sys.version_info < (3, 5), "Needs Python 3.5 or later.")
+class TestAsyncioEngine(TestCase):
+    """Test running jobs on the asyncio engine."""
+
+    def setUp(self):
+        from RTagsComplete.plugin import engine
+
+        self.engine = engine.AsyncioEngine()
+        self.addCleanup(self.engine.close)
+
+    def test_monitor(self):
+        """Test that the monitor outlives the configured rc timeout."""
+        get = settings.get
+
+        def short_timeout(key, default=None):
+            if key == 'rc_timeout':
+                return 0.2
+            return get(key, default)
+
+        consumer = mock.Mock()
+
+        with mock.patch.object(settings, 'get', side_effect=short_timeout):
+            job = TestMonitorJob("TestMonitorJob", consumer)
+
+            (_, _, error) = self.engine.run_async(job).result(timeout=10)
+
+        self.assertIsNone(error)
+        consumer.assert_called_once_with(
+            "a.cpp",
+            {'warning': [], 'error': [], 'note': []})
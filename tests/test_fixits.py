@@ -3,8 +3,13 @@ import time
 
 from os import path
 from os import environ
+from unittest import TestCase
+from unittest import mock
 from unittest import skipIf
 
+from RTagsComplete.plugin import diagnostics
+from RTagsComplete.plugin import fixits
+from RTagsComplete.plugin import monitor
 from RTagsComplete.plugin import vc_manager
 from RTagsComplete.tests.gui_wrapper import GuiTestWrapper
 
@@ -54,3 +59,55 @@ class TestFixitsController(GuiTestWrapper):
 
         self.assertEqual(self.view.get_status(
             controller.status.progress.status_key), '')
+
+
+class TestFixitsIssues(TestCase):
+    """Test showing issues on a controller that never got any."""
+
+    ISSUES = {
+        'error': [{'line': 1, 'column': 1, 'message': "message"}],
+        'warning': []
+    }
+
+    def setUp(self):
+        self.view = mock.Mock()
+        self.view.file_name.return_value = "a.cpp"
+        self.view.is_dirty.return_value = False
+
+        self.status = mock.Mock()
+
+        # Drawing is up to Sublime.
+        for method in ['update_regions', 'update_phantoms', 'show_regions']:
+            patch = mock.patch.object(fixits.Controller, method)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.store = diagnostics.Store()
+        patch = mock.patch.object(diagnostics, 'store', self.store)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_activated(self):
+        """Test that stored diagnostics show on a fresh controller."""
+        self.store.put("a.cpp", self.ISSUES)
+
+        controller = fixits.Controller(self.view, True, self.status)
+        controller.activated()
+
+        self.assertEqual(controller.issues['error'], self.ISSUES['error'])
+        self.status.update_results.assert_called_with(1, 0)
+
+    def test_routed(self):
+        """Test that monitored diagnostics reach an untouched controller."""
+        controller = mock.Mock()
+        controller.fixits = fixits.Controller(self.view, True, self.status)
+
+        with mock.patch.object(
+                vc_manager,
+                'controllers_of',
+                return_value=[controller]):
+            monitor.Monitor.deliver("a.cpp", self.ISSUES)
+
+        self.assertEqual(
+            controller.fixits.issues['error'],
+            self.ISSUES['error'])
@@ -0,0 +1,73 @@
+"""Tests for symbol info on hover."""
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import info
+from RTagsComplete.plugin import jobs
+
+
+class TestHover(TestCase):
+    """Test debouncing hover requests."""
+
+    def setUp(self):
+        self.timers = []
+
+        self.view = mock.Mock()
+        self.view.id.return_value = 1
+        self.view.rowcol.side_effect = lambda point: (0, point)
+
+        patches = [
+            mock.patch(
+                'sublime.set_timeout',
+                side_effect=lambda callback, delay=0: self.timers.append(
+                    callback)),
+            mock.patch.object(jobs.JobController, 'supersede'),
+            mock.patch(
+                'RTagsComplete.plugin.settings.get',
+                return_value=300)
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_debounce(self):
+        """Test that rapid hovers only query symbol info of the last."""
+        for point in [3, 5, 8]:
+            info.Hover.request(self.view, point)
+
+        # Each hover drops the query of the one before.
+        self.assertEqual(jobs.JobController.supersede.call_count, 3)
+
+        for timer in self.timers:
+            timer()
+
+        self.assertEqual(self.view.run_command.call_count, 1)
+        (command, args) = self.view.run_command.call_args[0]
+        self.assertEqual(command, 'rtags_symbol_info')
+        self.assertEqual((args['row'], args['col']), (0, 8))
+        self.assertEqual(args['channel'], info.Hover.CHANNEL)
+
+        self.assertTrue(info.Hover.current(self.view, 8))
+        self.assertFalse(info.Hover.current(self.view, 3))
+
+    def test_cancel(self):
+        """Test that a cancelled hover never queries."""
+        info.Hover.request(self.view, 3)
+        info.Hover.cancel(self.view)
+
+        for timer in self.timers:
+            timer()
+
+        self.assertEqual(self.view.run_command.call_count, 0)
+        self.assertFalse(info.Hover.current(self.view, 3))
+
+    def test_closed(self):
+        """Test that hovers over a view closed meanwhile never query."""
+        info.Hover.request(self.view, 3)
+        self.view.window.return_value = None
+
+        for timer in self.timers:
+            timer()
+
+        self.assertEqual(self.view.run_command.call_count, 0)
@@ -3,12 +3,14 @@ import time
 import uuid
 import os
 import tempfile
+import threading
 
 from concurrent import futures
 from functools import partial
 from unittest import TestCase, mock, skip
 
 from RTagsComplete.plugin import jobs
+from RTagsComplete.plugin import metrics
 
 
 class TestJob(jobs.RTagsJob):
@@ -187,3 +189,268 @@ class TestJobController(TestCase):
             else:
                 self.assertIsNone(received_error)
                 self.assertEqual(received_out, stdout)
+
+    def test_async_cancel(self):
+        """Test that cancelling a job returns right away and drops its
+           late result."""
+        job_id = "TestAsyncCancelCommand" + jobs.JobController.next_id()
+        callback = mock.Mock()
+
+        future = jobs.JobController.run_async(
+            TestJob(job_id, ['/bin/sh', '-c', 'sleep 10000'], timeout=10),
+            callback)
+
+        time.sleep(1)
+
+        start_time = time.time()
+        jobs.JobController.cancel(job_id)
+        self.assertLess(time.time() - start_time, 0.5)
+
+        futures.wait([future], timeout=15, return_when=futures.ALL_COMPLETED)
+        self.assertTrue(future.done())
+        self.assertEqual(callback.call_count, 0)
+
+    def test_channel_supersede(self):
+        """Test that a job on the same channel supersedes its predecessor."""
+        view = mock.Mock()
+        view.id.return_value = 4711
+
+        first_callback = mock.Mock()
+        second_callback = mock.Mock()
+
+        first_job = TestJob(
+            "TestChannelFirst" + jobs.JobController.next_id(),
+            ['/bin/sh', '-c', 'sleep 10000'],
+            timeout=10)
+        first_job.view = view
+        first_job.channel = "test"
+
+        second_job = TestJob(
+            "TestChannelSecond" + jobs.JobController.next_id(),
+            ['/bin/sh', '-c', 'echo foo'],
+            timeout=10)
+        second_job.view = view
+        second_job.channel = "test"
+
+        first_future = jobs.JobController.run_async(first_job, first_callback)
+        second_future = jobs.JobController.run_async(
+            second_job,
+            second_callback)
+
+        futures.wait(
+            [first_future, second_future],
+            timeout=15,
+            return_when=futures.ALL_COMPLETED)
+
+        self.assertTrue(first_job.cancelled)
+        self.assertEqual(first_callback.call_count, 0)
+        self.assertEqual(second_callback.call_count, 1)
+
+    def test_coalesce(self):
+        """Test that identical in-flight jobs share a single process."""
+        command = ['/bin/sh', '-c', 'sleep 0.5 && echo foo']
+
+        first_callback = mock.Mock()
+        second_callback = mock.Mock()
+
+        first_future = jobs.JobController.run_async(
+            TestJob("TestCoalesce" + jobs.JobController.next_id(), command),
+            first_callback)
+        second_future = jobs.JobController.run_async(
+            TestJob("TestCoalesce" + jobs.JobController.next_id(), command),
+            second_callback)
+
+        self.assertIs(first_future, second_future)
+
+        futures.wait([first_future], return_when=futures.ALL_COMPLETED)
+
+        (_, received_out, received_error) = first_future.result()
+
+        self.assertEqual(received_error, None)
+        self.assertEqual(received_out, b'foo\n')
+
+        # Callbacks are invoked right after waiters got notified.
+        deadline = time.time() + 5
+        while second_callback.call_count == 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(first_callback.call_count, 1)
+        self.assertEqual(second_callback.call_count, 1)
+
+    def test_coalesce_cancel_leader(self):
+        """Test that cancelling a queued leader keeps serving followers."""
+        lane = jobs.Lane("test", 1)
+
+        leader_callback = mock.Mock()
+        follower_callback = mock.Mock()
+
+        command = ['/bin/sh', '-c', 'echo foo']
+
+        with mock.patch.object(jobs.JobController, 'lane', return_value=lane):
+            # Keep the lane busy, so the leader has to wait.
+            blocker = jobs.JobController.run_async(TestJob(
+                "TestBlocker" + jobs.JobController.next_id(),
+                ['/bin/sh', '-c', 'sleep 0.5']))
+
+            leader = TestJob("TestLeader" + jobs.JobController.next_id(),
+                             command)
+            future = jobs.JobController.run_async(leader, leader_callback)
+            jobs.JobController.run_async(
+                TestJob("TestFollower" + jobs.JobController.next_id(),
+                        command),
+                follower_callback)
+
+            jobs.JobController.cancel(leader.job_id)
+
+        futures.wait([blocker, future], timeout=15)
+
+        (_, received_out, received_error) = future.result()
+
+        self.assertEqual(received_error, None)
+        self.assertEqual(received_out, b'foo\n')
+
+        deadline = time.time() + 5
+        while follower_callback.call_count == 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(follower_callback.call_count, 1)
+        self.assertEqual(leader_callback.call_count, 0)
+
+
+def streaming_job(command_info):
+    return jobs.StreamingJob(
+        "RTReferencesJob" + jobs.JobController.next_id(),
+        command_info,
+        lambda lines: True,
+        **{'data': b'', 'view': None, 'coalesce': False})
+
+
+@mock.patch.object(
+    jobs.StreamingJob, 'prepare_command', lambda self: self.command_info)
+class TestStreaming(TestCase):
+    """Test streaming jobs."""
+
+    def tearDown(self):
+        jobs.JobController.stop_all()
+        super().tearDown()
+
+    def test_category(self):
+        """Test streaming jobs being told apart by their id."""
+        metrics.reset()
+
+        (_, out, error) = jobs.JobController.run_sync(
+            streaming_job(['/bin/sh', '-c', 'echo foo; echo bar']))
+
+        self.assertEqual(error, None)
+        self.assertEqual(out, b'foo\nbar')
+
+        report = metrics.report()["RTReferencesJob"]
+        self.assertEqual(report["roundtrip"]["count"], 1)
+        self.assertEqual(report["decode"]["count"], 1)
+
+    def test_failure(self):
+        """Test failing streaming jobs reporting their output."""
+        (_, _, error) = jobs.JobController.run_sync(
+            streaming_job(['/bin/sh', '-c', 'echo foo; echo bar; exit 1']))
+
+        self.assertNotEqual(error, None)
+        self.assertIn("foo\nbar", error.message)
+
+
+class TestLane(TestCase):
+    """Test scheduling within a lane."""
+
+    def test_round_robin(self):
+        """Test that queued jobs get dispatched in turns across views."""
+        lane = jobs.Lane("test", 1)
+        order = []
+        release = threading.Event()
+
+        lane.submit(release.wait, "blocker")
+
+        submitted = [lane.submit(partial(order.append, name), owner)
+                     for (name, owner) in [("a1", "a"), ("a2", "a"),
+                                           ("a3", "a"), ("b1", "b"),
+                                           ("b2", "b")]]
+
+        self.assertEqual(lane.stats()['queued'], 5)
+
+        release.set()
+        futures.wait(submitted, timeout=5)
+
+        self.assertEqual(order, ["a1", "b1", "a2", "b2", "a3"])
+
+    def test_capacity(self):
+        """Test that no more jobs than the capacity run at a time."""
+        lane = jobs.Lane("test", 2)
+        started = [threading.Event() for _ in range(3)]
+        release = threading.Event()
+
+        def job(index):
+            started[index].set()
+            release.wait(5)
+
+        submitted = [lane.submit(partial(job, index), index)
+                     for index in range(3)]
+
+        self.assertTrue(started[0].wait(5))
+        self.assertTrue(started[1].wait(5))
+        self.assertFalse(started[2].is_set())
+        self.assertEqual(lane.stats()['running'], 2)
+        self.assertEqual(lane.stats()['queued'], 1)
+
+        release.set()
+        futures.wait(submitted, timeout=5)
+        lane.pool.shutdown()
+
+        self.assertTrue(started[2].is_set())
+        self.assertEqual(lane.stats()['running'], 0)
+
+
+class TestResultCache(TestCase):
+    """Test Result Cache."""
+
+    def test_invalidate(self):
+        """Test that reindexing a file drops its results and all project
+           scoped ones."""
+        cache = jobs.ResultCache()
+        cache.monitoring(True)
+
+        info_key = (('--symbol-info', 'a.cpp:1:1'), 'a.cpp', 1)
+        other_key = (('--symbol-info', 'b.cpp:1:1'), 'b.cpp', 1)
+        references_key = (('-r', 'b.cpp:1:1'), 'b.cpp', 1)
+
+        cache.put(info_key, jobs.ResultCache.FILE, ('1', b'a', None))
+        cache.put(other_key, jobs.ResultCache.FILE, ('2', b'b', None))
+        cache.put(references_key, jobs.ResultCache.PROJECT, ('3', b'c', None))
+
+        self.assertEqual(cache.get(info_key), ('1', b'a', None))
+
+        cache.invalidate('a.cpp')
+
+        self.assertIsNone(cache.get(info_key))
+        self.assertIsNone(cache.get(references_key))
+        self.assertEqual(cache.get(other_key), ('2', b'b', None))
+
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_unmonitored(self):
+        """Test that project scoped results are only cached while
+           monitoring."""
+        cache = jobs.ResultCache()
+
+        info_key = (('--symbol-info', 'a.cpp:1:1'), 'a.cpp', 1)
+        references_key = (('-r', 'a.cpp:1:1'), 'a.cpp', 1)
+
+        cache.put(references_key, jobs.ResultCache.PROJECT, ('1', b'a', None))
+        self.assertIsNone(cache.get(references_key))
+
+        cache.monitoring(True)
+        cache.put(info_key, jobs.ResultCache.FILE, ('2', b'b', None))
+        cache.put(references_key, jobs.ResultCache.PROJECT, ('1', b'a', None))
+        self.assertEqual(cache.get(references_key), ('1', b'a', None))
+
+        cache.monitoring(False)
+        self.assertIsNone(cache.get(references_key))
+        self.assertEqual(cache.get(info_key), ('2', b'b', None))
@@ -0,0 +1,79 @@
+"""Tests for the incremental JSON stream decoder."""
+import json
+
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import jsonstream
+
+
+class TestJSONStream(TestCase):
+    """Test decoding concatenated JSON values."""
+
+    def test_lines(self):
+        """Test values spread over several lines."""
+        stream = jsonstream.JSONStream()
+
+        self.assertEqual(list(stream.feed(b'{"checkStyle": {\n')), [])
+        self.assertEqual(list(stream.feed(b'  "a.cpp": []\n')), [])
+        self.assertEqual(
+            list(stream.feed(b'}}\n')),
+            [{'checkStyle': {'a.cpp': []}}])
+        self.assertEqual(stream.pending(), 0)
+
+    def test_braces_in_strings(self):
+        """Test that braces and escaped quotes within strings are ignored."""
+        stream = jsonstream.JSONStream()
+
+        value = {'message': 'expected \'}\' "{" \\ [', 'line': 1}
+
+        self.assertEqual(
+            list(stream.feed(json.dumps(value).encode('utf-8') + b'\n')),
+            [value])
+
+    def test_split_chunks(self):
+        """Test values split at arbitrary bytes, multi-byte ones included."""
+        values = [
+            {'message': 'unused variable äöü \\"x\\"'},
+            {'progress': [1, 2, {'nested': '}'}]}
+        ]
+
+        data = "".join(json.dumps(value) + "\n" for value in values) \
+            .encode('utf-8')
+
+        stream = jsonstream.JSONStream()
+
+        result = []
+        for index in range(len(data)):
+            result.extend(stream.feed(data[index:index + 1]))
+
+        self.assertEqual(result, values)
+
+    def test_skip_garbage(self):
+        """Test that text in between values and broken values get dropped."""
+        stream = jsonstream.JSONStream()
+
+        self.assertEqual(
+            list(stream.feed(b'noise\n{"a": 1}\n{"b": }\n[2]\n')),
+            [{'a': 1}, [2]])
+
+    def test_compact(self):
+        """Test many values per chunk, with the buffer getting compacted."""
+        values = [{'line': index, 'message': "'}' " * index}
+                  for index in range(50)]
+
+        data = "".join(
+            json.dumps(value, indent=1) + "\n" for value in values) \
+            .encode('utf-8')
+
+        stream = jsonstream.JSONStream()
+
+        result = []
+        with mock.patch.object(jsonstream.JSONStream, 'WINDOW', 8), \
+                mock.patch.object(jsonstream.JSONStream, 'COMPACT', 64):
+            for index in range(0, len(data), 100):
+                result.extend(stream.feed(data[index:index + 100]))
+                self.assertLess(len(stream.buffer), 300)
+
+        self.assertEqual(result, values)
+        self.assertEqual(stream.pending(), 0)
@@ -0,0 +1,57 @@
+"""Tests for Metrics."""
+import json
+
+from unittest import TestCase
+
+from RTagsComplete.plugin import metrics
+
+
+class TestMetrics(TestCase):
+    """Test latency histograms and reports."""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_category(self):
+        """Test that job ids loose their unique index."""
+        self.assertEqual(
+            metrics.category("RTFollowSymbolJob42"),
+            "RTFollowSymbolJob")
+        self.assertEqual(
+            metrics.category("ReindexWatchdogJob"),
+            "ReindexWatchdogJob")
+
+    def test_percentiles(self):
+        """Test that percentiles stay within the histogram precision."""
+        histogram = metrics.Histogram()
+
+        for i in range(1, 1001):
+            histogram.record(i / 1000.0)
+
+        self.assertEqual(histogram.count, 1000)
+        self.assertEqual(histogram.maximum, 1.0)
+
+        for percent in metrics.PERCENTILES:
+            expected = percent / 100.0
+            value = histogram.percentile(percent)
+            self.assertGreaterEqual(value, expected)
+            self.assertLessEqual(value, expected * metrics.Histogram.GROWTH)
+
+    def test_empty(self):
+        """Test that an empty histogram reports zeros."""
+        histogram = metrics.Histogram()
+
+        self.assertEqual(histogram.percentile(99), 0.0)
+        self.assertEqual(histogram.summary()['count'], 0)
+
+    def test_report(self):
+        """Test that recorded phases show up in text and JSON reports."""
+        with metrics.Timer("CompletionJob", "parse"):
+            pass
+        metrics.record("CompletionJob", "total", 0.25)
+
+        report = json.loads(metrics.as_json())['metrics']
+
+        self.assertEqual(report["CompletionJob"]["total"]["count"], 1)
+        self.assertEqual(report["CompletionJob"]["parse"]["count"], 1)
+        self.assertIn("CompletionJob", metrics.as_text())
@@ -0,0 +1,83 @@
+"""Tests for the reindex scheduler."""
+from concurrent import futures
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import jobs
+from RTagsComplete.plugin import reindex
+
+
+class TestScheduler(TestCase):
+    """Test coalescing and batching reindex requests."""
+
+    def setUp(self):
+        reindex.Scheduler.pending.clear()
+        reindex.Scheduler.running.clear()
+        reindex.Scheduler.scheduled = False
+
+        self.submitted = []
+        self.futures = []
+
+        def run_async(job, callback=None, indicator=None):
+            future = futures.Future()
+            self.submitted.append(job)
+            self.futures.append(future)
+            return future
+
+        patches = [
+            mock.patch.object(jobs.JobController, 'run_async', run_async),
+            mock.patch('sublime.set_timeout_async'),
+            mock.patch.object(
+                reindex.Scheduler, 'concurrency', return_value=1)
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_coalescing(self):
+        """Test that the latest request of a file replaces waiting ones."""
+        reindex.Scheduler.submit("a.cpp", b'1')
+        reindex.Scheduler.submit("b.cpp", b'2')
+        reindex.Scheduler.submit("a.cpp", b'3')
+
+        reindex.Scheduler.dispatch()
+
+        self.assertEqual(len(self.submitted), 1)
+        self.assertIsInstance(self.submitted[0], jobs.ReindexJob)
+        self.assertEqual(self.submitted[0].data, b'3')
+
+        # The file being reindexed waits for its former request.
+        reindex.Scheduler.submit("a.cpp", b'4')
+
+        self.futures[0].set_result((0, b'', None))
+        reindex.Scheduler.dispatch()
+
+        self.assertEqual(self.submitted[1].data, b'2')
+
+        self.futures[1].set_result((0, b'', None))
+        reindex.Scheduler.dispatch()
+
+        self.assertEqual(self.submitted[2].data, b'4')
+        self.assertEqual(
+            reindex.Scheduler.stats(),
+            {'pending': 0, 'running': 1})
+
+    def test_batch(self):
+        """Test that saved files get reindexed through a single job."""
+        reindex.Scheduler.submit_batch(
+            [reindex.Request(name) for name in ["a.cpp", "b.cpp", "c.cpp"]])
+        reindex.Scheduler.submit("d.cpp", b'unsaved')
+
+        reindex.Scheduler.dispatch()
+
+        self.assertIsInstance(self.submitted[0], jobs.BatchReindexJob)
+        self.assertEqual(
+            self.submitted[0].command_info,
+            ["-V", "a.cpp", "-V", "b.cpp", "-V", "c.cpp"])
+
+        self.futures[0].set_result((0, b'', None))
+        reindex.Scheduler.dispatch()
+
+        self.assertIsInstance(self.submitted[1], jobs.ReindexJob)
+        self.assertEqual(reindex.Scheduler.stats()['pending'], 0)
@@ -0,0 +1,97 @@
+"""Tests for the rename engine."""
+import os
+import tempfile
+
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import rename
+
+
+class TestRename(TestCase):
+    """Test renaming files that are not open."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.unlink(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def write(self, name, contents):
+        file = os.path.join(self.directory, name)
+        with open(file, 'wb') as out_file:
+            out_file.write(contents)
+        return file
+
+    def read(self, file):
+        with open(file, 'rb') as in_file:
+            return in_file.read()
+
+    def test_prepare(self):
+        """Test that line endings and multi-byte characters survive."""
+        file = self.write("a.cpp", "// ä\r\nint foo; ~foo();\r\n".encode())
+
+        engine = rename.Rename("foo", "bar", {file: {2: [5, 10]}})
+
+        prepared = engine.prepare(file)
+
+        self.assertEqual(
+            self.read(prepared.temp),
+            "// ä\r\nint bar; ~bar();\r\n".encode())
+        self.assertEqual(self.read(file), prepared.original)
+
+        rename.Rename.discard([prepared])
+
+    @mock.patch('RTagsComplete.plugin.rename.Rename.failed')
+    def test_all_or_nothing(self, failed):
+        """Test that a single mismatch leaves all files untouched."""
+        good = self.write("good.cpp", b'int foo;\n')
+        bad = self.write("bad.cpp", b'int baz;\n')
+
+        engine = rename.Rename(
+            "foo",
+            "bar",
+            {good: {1: [5]}, bad: {1: [5]}})
+
+        engine.write()
+
+        self.assertTrue(failed.called)
+        self.assertEqual(self.read(good), b'int foo;\n')
+        self.assertEqual(self.read(bad), b'int baz;\n')
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ["bad.cpp", "good.cpp"])
+
+    @mock.patch('RTagsComplete.plugin.rename.Rename.failed')
+    def test_out_of_range(self, failed):
+        """Test that a stale line leaves all files and no temp files."""
+        good = self.write("good.cpp", b'int foo;\n')
+        bad = self.write("bad.cpp", b'int foo;\n')
+
+        engine = rename.Rename(
+            "foo",
+            "bar",
+            {good: {1: [5]}, bad: {7: [5]}})
+
+        engine.write()
+
+        self.assertTrue(failed.called)
+        self.assertIsInstance(failed.call_args[0][0], rename.RenameError)
+        self.assertEqual(self.read(good), b'int foo;\n')
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ["bad.cpp", "good.cpp"])
+
+        # Anything unexpected does not get past us either.
+        with mock.patch.object(
+                rename.tools.Utilities,
+                'replace_in_lines',
+                side_effect=UnicodeDecodeError('utf-8', b'', 0, 1, "bad")):
+            engine.write()
+
+        self.assertEqual(failed.call_count, 2)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ["bad.cpp", "good.cpp"])
@@ -0,0 +1,48 @@
+"""Tests for buffer snapshots."""
+
+import sublime
+
+from os import path
+
+from RTagsComplete.plugin import snapshot
+
+from RTagsComplete.tests.gui_wrapper import GuiTestWrapper
+
+
+class TestSnapshot(GuiTestWrapper):
+    """Test buffer snapshots."""
+
+    def setUp(self):
+        super().setUp()
+        file_name = path.join(path.dirname(__file__),
+                              'test_files',
+                              'test_fixits.cpp')
+        self.set_up_view(file_name)
+
+        self.assertIsNotNone(self.view)
+
+        snapshot.clear()
+
+    def test_reuse(self):
+        """Test that an unchanged buffer is encoded only once."""
+        first = snapshot.text(self.view)
+        second = snapshot.text(self.view)
+
+        self.assertIs(first, second)
+        self.assertEqual(
+            first,
+            bytes(self.view.substr(sublime.Region(0, self.view.size())),
+                  "utf-8"))
+
+    def test_change(self):
+        """Test that a changed buffer gets encoded anew."""
+        first = snapshot.text(self.view)
+
+        self.view.run_command("append", {"characters": "// changed\n"})
+
+        second = snapshot.text(self.view)
+
+        self.assertNotEqual(first, second)
+        self.assertTrue(second.endswith(b"// changed\n"))
+
+        self.view.run_command("undo")
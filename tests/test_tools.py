@@ -32,3 +32,24 @@ class TestTools(TestCase):
             self.assertEqual(contents, "echo bar && sleep 1\n")
 
         os.unlink(name)
+
+    def test_file_content(self):
+        """Test reading single lines and parts of them."""
+        with tempfile.NamedTemporaryFile(delete=False) as out_file:
+            name = out_file.name
+            out_file.write(b'int a;\r\nint b;\n\nint c;')
+
+        self.assertEqual(tools.Utilities.file_content(name, 1), "int a;")
+        self.assertEqual(tools.Utilities.file_content(name, 2, 5, 1), "b")
+        self.assertEqual(tools.Utilities.file_content(name, 3), "")
+        self.assertEqual(tools.Utilities.file_content(name, 4), "int c;")
+        self.assertEqual(tools.Utilities.file_content(name, 5), "")
+
+        # Modifying the file invalidates its index.
+        with open(name, 'w') as out_file:
+            out_file.write("long a;\n")
+
+        self.assertEqual(tools.Utilities.file_content(name, 1), "long a;")
+        self.assertEqual(tools.Utilities.file_content(name, 2), "")
+
+        os.unlink(name)
@@ -0,0 +1,63 @@
+"""Tests for trace event recording."""
+import json
+import os
+import tempfile
+
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import trace
+
+
+class TestTrace(TestCase):
+    """Test the trace ring-buffer."""
+
+    def setUp(self):
+        self.settings = {'trace_events': True, 'trace_buffer_size': 3}
+
+        patch = mock.patch(
+            'RTagsComplete.plugin.settings.get',
+            side_effect=lambda key, default=None: self.settings.get(
+                key, default))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        trace.clear()
+        self.addCleanup(trace.clear)
+
+    def dump(self):
+        (handle, file) = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        self.addCleanup(os.remove, file)
+
+        count = trace.dump(file)
+
+        with open(file) as in_file:
+            events = json.load(in_file)['traceEvents']
+
+        self.assertEqual(count, len(events))
+
+        return [event['name'] for event in events if event['ph'] != 'M']
+
+    def test_bound(self):
+        """Test that the oldest events get dropped first."""
+        for index in range(5):
+            trace.instant("event{}".format(index), 'test')
+
+        self.assertEqual(self.dump(), ["event2", "event3", "event4"])
+
+        # Shrinking keeps the latest events.
+        self.settings['trace_buffer_size'] = 2
+        trace.instant("event5", 'test')
+
+        self.assertEqual(self.dump(), ["event4", "event5"])
+
+    def test_disabled(self):
+        """Test that nothing gets recorded unless enabled."""
+        self.settings['trace_events'] = False
+
+        trace.instant("event", 'test')
+        with trace.Span("span", 'test'):
+            pass
+
+        self.assertEqual(self.dump(), [])
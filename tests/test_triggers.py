@@ -0,0 +1,104 @@
+"""Tests for completion trigger evaluation."""
+import re
+import sublime
+
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import triggers
+
+
+class FakeView():
+    """Plain text with comments and a few type names scoped."""
+
+    TYPES = {"int", "Foo"}
+
+    def __init__(self, text):
+        self.text = text
+
+    def id(self):
+        return 1
+
+    def substr(self, point):
+        if isinstance(point, sublime.Region):
+            return self.text[point.a:point.b]
+        return self.text[point:point + 1]
+
+    def word(self, point):
+        for match in re.finditer(r'\w+', self.text):
+            if match.start() <= point < match.end():
+                return sublime.Region(match.start(), match.end())
+        return sublime.Region(point, point)
+
+    def match_selector(self, point, selector):
+        if selector == triggers.IGNORED_SCOPES:
+            return "//" in self.text[:point]
+        return self.substr(self.word(point)) in FakeView.TYPES
+
+
+class TestTriggers(TestCase):
+    """Test gating triggers by context and acceptance."""
+
+    def worth(self, text, trigger=" "):
+        return triggers.worth_completing(FakeView(text), len(text), trigger)
+
+    def test_context(self):
+        """Test that whitespace only completes where it pays off."""
+        self.assertTrue(self.worth("  return "))
+        self.assertTrue(self.worth("foo( "))
+        self.assertTrue(self.worth("foo(a,  ", "  "))
+        self.assertTrue(self.worth("Foo "))
+        self.assertFalse(self.worth("a = b "))
+        self.assertFalse(self.worth("a; // return "))
+        self.assertFalse(self.worth("a; // a.", "."))
+        self.assertTrue(self.worth("a.", "."))
+
+    def test_acceptance(self):
+        """Test that rarely accepted triggers get suppressed."""
+        view = FakeView("")
+        acceptance = triggers.Acceptance()
+
+        with mock.patch(
+                'RTagsComplete.plugin.settings.get',
+                return_value=0.1):
+            for position in range(triggers.Acceptance.MIN_SAMPLES):
+                self.assertTrue(acceptance.allows("."))
+                self.assertTrue(acceptance.allows(" "))
+                acceptance.offered(view, ".", position)
+                acceptance.offered(view, ".", position)
+                acceptance.accept(view)
+                acceptance.offered(view, " ", position)
+
+            self.assertEqual(
+                acceptance.stats(),
+                {
+                    '.': {'shown': 20, 'accepted': 20},
+                    ' ': {'shown': 20, 'accepted': 0}
+                })
+
+            self.assertTrue(acceptance.allows("."))
+
+            allowed = [acceptance.allows(" ")
+                       for _ in range(triggers.Acceptance.PROBE)]
+            self.assertEqual(allowed.count(True), 1)
+
+    def test_moved(self):
+        """Test that offers left behind do not count as accepted."""
+        view = FakeView("a.foo; b.")
+        acceptance = triggers.Acceptance()
+
+        acceptance.offered(view, ".", 2)
+        acceptance.moved(view, 5)
+        acceptance.accept(view)
+
+        acceptance.offered(view, ".", 2)
+        acceptance.moved(view, 6)
+        acceptance.accept(view)
+
+        acceptance.offered(view, ".", 9)
+        acceptance.moved(view, 5)
+        acceptance.accept(view)
+
+        self.assertEqual(
+            acceptance.stats(),
+            {'.': {'shown': 3, 'accepted': 1}})
@@ -4,6 +4,7 @@ from os import path
 
 from RTagsComplete.plugin import vc_manager
 from RTagsComplete.plugin import settings
+from RTagsComplete.plugin import snapshot
 
 from RTagsComplete.tests.gui_wrapper import GuiTestWrapper
 
@@ -83,3 +84,35 @@ class TestVC(GuiTestWrapper):
             self.assertEqual(file, "item{}".format(i))
 
         self.assertEqual(len(vc_manager.history), 0)
+
+    def test_indexed(self):
+        """Test tracking the buffer state passed to the reindexer."""
+        vc_manager.close_all()
+
+        self.assertFalse(vc_manager.is_indexed(self.view))
+
+        vc_manager.set_indexed(self.view, snapshot.text(self.view))
+        self.assertTrue(vc_manager.is_indexed(self.view))
+
+        self.view.run_command("append", {"characters": "// changed\n"})
+        self.assertFalse(vc_manager.is_indexed(self.view))
+
+        # Undoing the change gets us back to the indexed contents.
+        self.view.run_command("undo")
+        self.assertTrue(vc_manager.is_indexed(self.view))
+
+    def test_controllers_of(self):
+        """Test looking up the viewcontrollers of a file."""
+        vc_manager.close_all()
+
+        controller = vc_manager.view_controller(self.view)
+
+        self.assertEqual(
+            vc_manager.controllers_of(self.view.file_name()),
+            [controller])
+
+        vc_manager.close(self.view)
+
+        self.assertEqual(
+            vc_manager.controllers_of(self.view.file_name()),
+            [])
@@ -0,0 +1,98 @@
+"""Tests for the indexing watchdog."""
+from unittest import TestCase
+from unittest import mock
+
+from RTagsComplete.plugin import jobs
+from RTagsComplete.plugin import watchdog
+
+
+class TestIndexWatchdog(TestCase):
+    """Test detecting the end of indexing."""
+
+    def setUp(self):
+        self.results = []
+
+        patches = [
+            mock.patch(
+                'sublime.set_timeout_async',
+                side_effect=lambda callback, delay=0: callback()),
+            mock.patch.object(watchdog.IndexWatchdog, 'schedule')
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.service = watchdog.IndexWatchdog()
+
+    def callback(self, name):
+        return lambda complete, error=None: self.results.append(
+            (name, complete))
+
+    def test_indexed(self):
+        """Test that monitored diagnostics end waiting for their file."""
+        self.service.start("a", self.callback("a"), ["a.cpp"])
+        self.service.start("b", self.callback("b"), ["b.cpp", "c.cpp"])
+
+        self.service.indexed("b.cpp")
+        self.service.indexed("a.cpp")
+        self.service.indexed("a.cpp")
+        self.assertEqual(self.results, [("a", True)])
+
+        self.service.indexed("c.cpp")
+        self.assertEqual(self.results, [("a", True), ("b", True)])
+        self.assertFalse(self.service.waiting("b"))
+
+    def test_progress(self):
+        """Test that only an indexing seen in progress ends waiting."""
+        self.service.start("a", self.callback("a"), ["a.cpp"])
+
+        self.service.progress(3, 3)
+        self.assertEqual(self.results, [])
+
+        self.service.progress(1, 3)
+        self.service.start("b", self.callback("b"), ["b.cpp"])
+        self.service.progress(3, 3)
+        self.assertEqual(self.results, [("a", True)])
+        self.assertTrue(self.service.waiting("b"))
+
+    def test_poll(self):
+        """Test that a single poll serves all waiters."""
+        self.service.start("a", self.callback("a"), ["a.cpp"])
+        self.service.start("b", self.callback("b"), ["b.cpp"])
+
+        with mock.patch.object(
+                jobs.JobController,
+                'run_sync',
+                side_effect=[(0, b'1\n', None), (0, b'0\n', None)]) as poll:
+            self.service.poll()
+            self.assertEqual(self.results, [])
+
+            self.service.poll()
+            self.assertEqual(poll.call_count, 2)
+
+        self.assertEqual(sorted(self.results), [("a", True), ("b", True)])
+
+        self.service.stop("a")
+        self.assertEqual(len(self.results), 2)
+
+    def test_monitored(self):
+        """Test polling only while the monitor is down or silent."""
+        self.service.monitoring(True)
+        self.service.start("a", self.callback("a"), ["a.cpp"])
+
+        with mock.patch.object(
+                jobs.JobController,
+                'run_sync',
+                return_value=(0, b'0\n', None)) as poll:
+            self.service.poll()
+            self.assertEqual(poll.call_count, 0)
+
+            self.service.heard_at -= watchdog.IndexWatchdog.SILENCE_TIMEOUT
+            self.service.poll()
+            self.assertEqual(poll.call_count, 1)
+
+            self.service.monitoring(False)
+            self.assertTrue(self.service.silent())
+            self.service.poll()
+            self.assertEqual(poll.call_count, 2)